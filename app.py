@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -36,6 +37,22 @@ with app.app_context():
     # Import models to ensure tables are created
     import models  # noqa: F401
     db.create_all()
+    # create_all skips existing tables, so add nullable columns and indexes
+    # defined since
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    for table in db.metadata.tables.values():
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.execute(text(
+                        f'ALTER TABLE {preparer.format_table(table)} '
+                        f'ADD COLUMN {preparer.format_column(column)} {column_type}'
+                    ))
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
 
 # Import and register blueprints
 from routes.auth_routes import auth_bp
@@ -52,6 +69,15 @@ app.register_blueprint(export_bp, url_prefix='/export')
 app.register_blueprint(ai_bp, url_prefix='/ai')
 app.register_blueprint(demo_bp, url_prefix='/demo')
 
+# Resume timetable generation jobs orphaned by a previous worker process
+from scheduler.jobs import recover_stale_jobs
+
+with app.app_context():
+    try:
+        recover_stale_jobs()
+    except Exception as e:
+        logging.error(f"Generation job recovery error: {e}")
+
 # Main route
 from flask import render_template, redirect, url_for
 from auth import login_required
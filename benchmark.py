@@ -0,0 +1,296 @@
+"""Timetable solver benchmark on synthetic institutions.
+
+    python benchmark.py                                 # every scale, monolithic strategy
+    python benchmark.py --scale medium --strategy lns --output lns.json
+    python benchmark.py --baseline benchmark_results.json   # flag regressions
+
+Every scenario generates its institution into a fresh SQLite database and
+runs in its own process, so timings and memory peaks do not depend on the
+scenarios run before it. Generation is seeded, and the solver gets a fixed
+seed and worker count, so results of different commits can be compared.
+"""
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime, time as clock
+from typing import Any, Dict, List
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+RESULTS_FILE = 'benchmark_results.json'
+
+# Objective weights every scenario is solved with, so quality is comparable
+BENCHMARK_RULES = {
+    'weight_wasted_capacity': 1,
+    'weight_idle_gaps': 3,
+    'weight_building_changes': 2,
+    'weight_late_slots': 2,
+}
+
+ROOM_CAPACITIES = [20, 30, 40, 60, 80, 120]
+BUILDINGS = ['Block A', 'Block B', 'Block C']
+
+
+@dataclass
+class Scale:
+    """Size and shape of a synthetic institution.
+
+    unavailability is the share of teacher timeslots marked unavailable.
+    capacity_tightness scales course sizes against the rooms they are drawn
+    for; at 1.0 the largest courses only just fit. lab_share is the share
+    of rooms and courses that are labs, and lab courses meet in two-period
+    blocks.
+    """
+    departments: int = 2
+    courses_per_department: int = 6
+    teachers_per_department: int = 3
+    rooms: int = 6
+    days: int = 5
+    periods_per_day: int = 6
+    unavailability: float = 0.1
+    capacity_tightness: float = 0.6
+    lab_share: float = 0.25
+    seed: int = 1
+    time_limit: float = 60.0
+    workers: int = 8
+
+
+SCALES = {
+    'small': Scale(),
+    'medium': Scale(departments=4, courses_per_department=10, teachers_per_department=4, rooms=12,
+                    periods_per_day=7),
+    'large': Scale(departments=6, courses_per_department=12, teachers_per_department=5, rooms=16,
+                   periods_per_day=8, capacity_tightness=0.8, time_limit=120.0),
+}
+
+
+def build_institution(name: str, scale: Scale) -> int:
+    """Generate a synthetic institution into the database and return its id"""
+    from app import db
+    from models import (Course, Department, FacultyAvailability, Institution, InstitutionRule, Room,
+                        Teacher, TimeSlot)
+
+    rnd = random.Random(scale.seed)
+    institution = Institution(name=f'Benchmark {name}', code=f'BM{scale.seed}'[:10])
+    db.session.add(institution)
+    db.session.flush()
+
+    departments = [Department(name=f'Department {d + 1}', code=f'D{d + 1}', institution_id=institution.id)
+                   for d in range(scale.departments)]
+    timeslots = [
+        TimeSlot(day_of_week=day, start_time=clock(8 + period, 0), end_time=clock(8 + period, 50),
+                 period_name=f'Period {period + 1}', institution_id=institution.id)
+        for day in range(scale.days) for period in range(scale.periods_per_day)
+    ]
+    labs = round(scale.rooms * scale.lab_share)
+    rooms = [
+        Room(name=f'Room {r + 1}', code=f'R{r + 1}', capacity=rnd.choice(ROOM_CAPACITIES),
+             room_type='lab' if r < labs else 'lecture', building=BUILDINGS[r % len(BUILDINGS)],
+             institution_id=institution.id)
+        for r in range(scale.rooms)
+    ]
+    db.session.add_all(departments + timeslots + rooms)
+    db.session.flush()
+
+    capacities = {room_type: [room.capacity for room in rooms if room.room_type == room_type]
+                  for room_type in ('lab', 'lecture')}
+    teachers = []
+    for department in departments:
+        for t in range(scale.teachers_per_department):
+            teachers.append(Teacher(name=f'Teacher {department.code}.{t + 1}',
+                                    email=f'{department.code.lower()}.{t + 1}@benchmark.edu',
+                                    employee_id=f'{department.code}-{t + 1}', department_id=department.id,
+                                    institution_id=institution.id, max_hours_per_week=20))
+        for c in range(scale.courses_per_department):
+            lab = bool(capacities['lab']) and rnd.random() < scale.lab_share
+            capacity = rnd.choice(capacities['lab' if lab else 'lecture'] or capacities['lab'])
+            students = max(5, int(capacity * scale.capacity_tightness * rnd.uniform(0.5, 1.0)))
+            db.session.add(Course(name=f'Course {department.code}.{c + 1}', code=f'{department.code}{c + 101}',
+                                  credits=2 if lab else rnd.choice([2, 3, 4]), department_id=department.id,
+                                  institution_id=institution.id, semester='Fall', year=2025,
+                                  student_count=students, duration_minutes=100 if lab else 50,
+                                  room_type='lab' if lab else None))
+    db.session.add_all(teachers)
+    db.session.flush()
+
+    db.session.add_all(
+        FacultyAvailability(teacher_id=teacher.id, timeslot_id=timeslot.id, is_available=False)
+        for teacher in teachers for timeslot in timeslots
+        if rnd.random() < scale.unavailability
+    )
+    rules = dict(BENCHMARK_RULES, solver_max_time_seconds=scale.time_limit,
+                 solver_num_workers=scale.workers, solver_random_seed=scale.seed)
+    db.session.add_all(
+        InstitutionRule(institution_id=institution.id, rule_name=rule_name, rule_value=str(value),
+                        rule_type='setting')
+        for rule_name, value in rules.items()
+    )
+    db.session.commit()
+    return institution.id
+
+
+def run_scenario(name: str, scale: Scale, strategy: str) -> Dict[str, Any]:
+    """Generate and solve one scenario in this process, which must own a fresh database"""
+    from app import app
+    from scheduler import create_scheduler
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        started = time.perf_counter()
+        institution_id = build_institution(name, scale)
+        generate_seconds = time.perf_counter() - started
+
+        scheduler = create_scheduler(institution_id, strategy)
+        started = time.perf_counter()
+        result = scheduler.generate_timetable()
+        total_seconds = time.perf_counter() - started
+
+    stats = scheduler.stats
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_memory_mb = usage / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    objective = stats.get('objective') or {}
+    return {
+        'scale': name,
+        'strategy': strategy,
+        'parameters': asdict(scale),
+        'success': result['success'],
+        'message': result['message'],
+        'generate_seconds': round(generate_seconds, 4),
+        'total_seconds': round(total_seconds, 4),
+        'timings': stats.get('timings', {}),
+        'variable_count': stats.get('variable_count'),
+        'full_variable_count': stats.get('full_variable_count'),
+        'constraint_count': stats.get('constraint_count'),
+        'session_count': stats.get('session_count'),
+        'entries_count': result.get('entries_count', 0),
+        'solver_status': (stats.get('solver') or {}).get('status'),
+        'objective': objective.get('total'),
+        'best_bound': objective.get('best_bound'),
+        'objective_terms': {term: values['value'] for term, values in objective.get('terms', {}).items()},
+        'peak_memory_mb': round(peak_memory_mb, 1),
+    }
+
+
+def run_in_subprocess(name: str, scale: Scale, strategy: str) -> Dict[str, Any]:
+    """Run one scenario in a child process against its own temporary SQLite database"""
+    with tempfile.TemporaryDirectory(prefix='timetable-benchmark-') as directory:
+        environment = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+        scenario = json.dumps({'name': name, 'scale': asdict(scale), 'strategy': strategy})
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', scenario],
+                                   env=environment, capture_output=True, text=True)
+    if completed.returncode != 0:
+        logging.error(f"Benchmark scenario {name}/{strategy} failed:\n{completed.stderr[-2000:]}")
+        return {'scale': name, 'strategy': strategy, 'parameters': asdict(scale), 'success': False,
+                'message': f'Benchmark process exited with status {completed.returncode}'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def current_commit() -> str:
+    """Short hash of the checked out commit, None outside a git checkout"""
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def find_regressions(runs: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Describe every run that is slower, worse or less successful than the same baseline run"""
+    previous = {(run['scale'], run['strategy']): run for run in baseline.get('runs', [])}
+    regressions = []
+    for run in runs:
+        before = previous.get((run['scale'], run['strategy']))
+        if not before:
+            continue
+        label = f"{run['scale']}/{run['strategy']}"
+        if before['success'] and not run['success']:
+            regressions.append(f"{label} no longer succeeds: {run['message']}")
+            continue
+        if before.get('parameters') != run.get('parameters'):
+            logging.warning(f"Skipping {label}, its parameters differ from the baseline")
+            continue
+        if not run['success']:
+            continue
+        slower = run['timings'].get('solve', 0) > tolerance * max(before['timings'].get('solve', 0), 0.1)
+        if slower:
+            regressions.append(f"{label} solve took {run['timings']['solve']:.2f}s, "
+                               f"baseline {before['timings'].get('solve', 0):.2f}s")
+        if before.get('objective') is not None and (run.get('objective') or 0) > before['objective']:
+            regressions.append(f"{label} objective {run['objective']}, baseline {before['objective']}")
+        if (run.get('peak_memory_mb') or 0) > tolerance * (before.get('peak_memory_mb') or float('inf')):
+            regressions.append(f"{label} peak memory {run['peak_memory_mb']} MB, "
+                               f"baseline {before['peak_memory_mb']} MB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark timetable generation on synthetic institutions.')
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                        help='scale to run, repeatable (default: every scale)')
+    parser.add_argument('--strategy', action='append',
+                        help='generation strategy to run, repeatable (default: monolithic)')
+    parser.add_argument('--seed', type=int, help='override the generator and solver seed of every scale')
+    parser.add_argument('--time-limit', type=float, help='override the solve time limit of every scale')
+    parser.add_argument('--output', default=RESULTS_FILE, help=f'results file (default: {RESULTS_FILE})')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='slowdown factor on solve time and memory counted as a regression')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        scenario = json.loads(args.scenario)
+        print(json.dumps(run_scenario(scenario['name'], Scale(**scenario['scale']), scenario['strategy'])))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    overrides = {}
+    if args.seed is not None:
+        overrides['seed'] = args.seed
+    if args.time_limit is not None:
+        overrides['time_limit'] = args.time_limit
+
+    runs = []
+    for name in args.scale or list(SCALES):
+        for strategy in args.strategy or ['monolithic']:
+            run = run_in_subprocess(name, replace(SCALES[name], **overrides), strategy)
+            logging.info(f"{name}/{strategy}: {run['message']} "
+                         f"({run.get('total_seconds', 0):.2f}s, {run.get('variable_count')} variables, "
+                         f"objective {run.get('objective')}, {run.get('peak_memory_mb')} MB)")
+            runs.append(run)
+
+    results = {
+        'commit': current_commit(),
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runs': runs,
+    }
+    with open(args.output, 'w') as handle:
+        json.dump(results, handle, indent=2)
+    logging.info(f"Wrote {len(runs)} results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = find_regressions(runs, json.load(handle), args.tolerance)
+        for regression in regressions:
+            logging.warning(f"Regression: {regression}")
+        if regressions:
+            return 1
+        logging.info(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
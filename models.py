@@ -104,6 +104,7 @@ class Course(db.Model):
     year = db.Column(db.Integer, nullable=False)
     student_count = db.Column(db.Integer, default=0)
     duration_minutes = db.Column(db.Integer, default=60)
+    room_type = db.Column(db.String(50), nullable=True)  # required room type, None = any room
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -146,6 +147,13 @@ class TimeSlot(db.Model):
 
 class TimetableEntry(db.Model):
     __tablename__ = 'timetable_entries'
+    __table_args__ = (
+        # Week views of one teacher, room or course section, and institution scans
+        db.Index('ix_timetable_entries_teacher_timeslot', 'teacher_id', 'timeslot_id'),
+        db.Index('ix_timetable_entries_room_timeslot', 'room_id', 'timeslot_id'),
+        db.Index('ix_timetable_entries_course_section', 'course_id', 'section'),
+        db.Index('ix_timetable_entries_institution_timeslot', 'institution_id', 'timeslot_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, ForeignKey('courses.id'), nullable=False)
@@ -200,3 +208,46 @@ class InstitutionRule(db.Model):
     
     # Relationships
     institution = relationship("Institution", back_populates="institution_rules")
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    institution_id = db.Column(db.Integer, ForeignKey('institutions.id'), nullable=False, index=True)
+    department_id = db.Column(db.Integer, ForeignKey('departments.id'), nullable=True)
+    requested_by = db.Column(db.Integer, ForeignKey('users.id'), nullable=True)
+    strategy = db.Column(db.String(30))  # generation strategy, None = institution default
+    incremental = db.Column(db.Boolean, default=False)  # keep the stored timetable where possible
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    message = db.Column(db.String(500))
+    result = db.Column(db.JSON)
+    progress = db.Column(db.JSON)  # improving solutions reported by the solver
+    stop_requested = db.Column(db.Boolean, default=False)
+    worker = db.Column(db.String(100))  # host:pid of the process running the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        # One queued or running job per institution and department, so
+        # identical requests made at the same time share one job
+        db.Index('uq_generation_jobs_active_department', 'institution_id', 'department_id', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running') AND department_id IS NOT NULL"),
+                 postgresql_where=db.text("status IN ('queued', 'running') AND department_id IS NOT NULL")),
+        db.Index('uq_generation_jobs_active_institution', 'institution_id', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running') AND department_id IS NULL"),
+                 postgresql_where=db.text("status IN ('queued', 'running') AND department_id IS NULL")),
+        # One running job per institution. Department runs would otherwise
+        # each treat the other department's old entries as taken and could
+        # double-book rooms once both are saved
+        db.Index('uq_generation_jobs_running', 'institution_id', unique=True,
+                 sqlite_where=db.text("status = 'running'"),
+                 postgresql_where=db.text("status = 'running'")),
+    )
+
+class TimetableVersion(db.Model):
+    __tablename__ = 'timetable_versions'
+    
+    institution_id = db.Column(db.Integer, ForeignKey('institutions.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # bumped by every change to the timetable
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
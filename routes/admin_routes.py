@@ -171,6 +171,7 @@ def add_course():
     semester = sanitize_input(request.form.get('semester', ''))
     year = request.form.get('year')
     student_count = request.form.get('student_count', 0)
+    room_type = request.form.get('room_type') or None
     
     errors = validate_required_fields(request.form, ['name', 'code', 'credits', 'department_id', 'semester', 'year'])
     if errors:
@@ -197,7 +198,8 @@ def add_course():
             institution_id=department.institution_id,
             semester=semester,
             year=int(year),
-            student_count=int(student_count)
+            student_count=int(student_count),
+            room_type=room_type
         )
         db.session.add(course)
         db.session.commit()
@@ -603,6 +605,12 @@ def process_setup_wizard():
             ('max_consecutive', request.form.get('max_consecutive', '3')),
             ('min_gap', request.form.get('min_gap', '10')),
             ('allow_back_to_back', '1' if request.form.get('allow_back_to_back') else '0'),
+            ('solver_max_time_seconds', request.form.get('solver_max_time_seconds', '60')),
+            ('solver_num_workers', request.form.get('solver_num_workers', '0')),
+            ('weight_wasted_capacity', request.form.get('weight_wasted_capacity', '0')),
+            ('weight_idle_gaps', request.form.get('weight_idle_gaps', '0')),
+            ('weight_building_changes', request.form.get('weight_building_changes', '0')),
+            ('weight_late_slots', request.form.get('weight_late_slots', '0')),
             ('academic_year', academic_year),
             ('institution_type', institution_type)
         ]
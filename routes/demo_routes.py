@@ -190,8 +190,9 @@ def clear_all_data():
     """Clear all academic data (admin only)"""
     try:
         # Clear in reverse dependency order
-        from models import TimetableEntry, FacultyAvailability
+        from models import TimetableEntry, FacultyAvailability, TimetableVersion, GenerationJob
         
+        GenerationJob.query.delete()
         TimetableEntry.query.delete()
         FacultyAvailability.query.delete()
         Course.query.delete()
@@ -199,6 +200,7 @@ def clear_all_data():
         Room.query.delete()
         TimeSlot.query.delete()
         Department.query.delete()
+        TimetableVersion.query.delete()
         Institution.query.delete()
         
         # Clear session data
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, flash, redirect, url_for, make_response, send_file
 from auth import login_required, role_required, get_current_user
 from models import TimetableEntry, Course, Teacher, Room, TimeSlot
+from scheduler.persistence import timetable_version
+from utils.http_cache import EXPORT_CACHE_CONTROL, not_modified, timetable_etag, with_validators
+from utils.timetable_analytics import timetable_analytics
 import pandas as pd
 import io
 from datetime import datetime
@@ -8,6 +11,12 @@ import logging
 
 export_bp = Blueprint('export', __name__)
 
+def _export_validators(user, export_format: str):
+    """Timetable version and ETag of an export of the user's part of the timetable"""
+    department_id = user.department_id if user.role == 'faculty' else None
+    version = timetable_version(user.institution_id)
+    return version, timetable_etag(version, export_format, user.institution_id, department_id)
+
 @export_bp.route('/excel')
 @login_required
 @role_required('admin', 'faculty')
@@ -18,6 +27,12 @@ def export_excel():
         flash('You must be associated with an institution.', 'error')
         return redirect(url_for('timetable.view_timetable'))
     
+    # Unchanged since the client's copy: answer without loading entries
+    version, etag = _export_validators(user, 'excel')
+    response = not_modified(etag, version, EXPORT_CACHE_CONTROL)
+    if response:
+        return response
+    
     try:
         # Get timetable entries
         query = TimetableEntry.query.filter_by(institution_id=user.institution_id)
@@ -93,7 +108,7 @@ def export_excel():
         response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         response.headers['Content-Disposition'] = f'attachment; filename=timetable_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
         
-        return response
+        return with_validators(response, etag, version, EXPORT_CACHE_CONTROL)
         
     except Exception as e:
         logging.error(f"Excel export error: {e}")
@@ -110,6 +125,12 @@ def export_csv():
         flash('You must be associated with an institution.', 'error')
         return redirect(url_for('timetable.view_timetable'))
     
+    # Unchanged since the client's copy: answer without loading entries
+    version, etag = _export_validators(user, 'csv')
+    response = not_modified(etag, version, EXPORT_CACHE_CONTROL)
+    if response:
+        return response
+    
     try:
         # Get timetable entries
         query = TimetableEntry.query.filter_by(institution_id=user.institution_id)
@@ -160,7 +181,7 @@ def export_csv():
         response.headers['Content-Type'] = 'text/csv'
         response.headers['Content-Disposition'] = f'attachment; filename=timetable_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
         
-        return response
+        return with_validators(response, etag, version, EXPORT_CACHE_CONTROL)
         
     except Exception as e:
         logging.error(f"CSV export error: {e}")
@@ -177,71 +198,82 @@ def export_summary():
         flash('You must be associated with an institution.', 'error')
         return redirect(url_for('timetable.view_timetable'))
     
+    # Unchanged since the client's copy: answer without loading entries
+    version, etag = _export_validators(user, 'summary')
+    response = not_modified(etag, version, EXPORT_CACHE_CONTROL)
+    if response:
+        return response
+    
     try:
-        # Get timetable entries
-        query = TimetableEntry.query.filter_by(institution_id=user.institution_id)
-        
         # Faculty can only export their department
-        if user.role == 'faculty' and user.department_id:
-            query = query.join(Course).filter(Course.department_id == user.department_id)
-        
-        entries = query.all()
+        department_id = user.department_id if user.role == 'faculty' else None
+        analytics = timetable_analytics(user.institution_id, department_id)
         
-        if not entries:
+        if not analytics['total_classes']:
             flash('No timetable data to export.', 'warning')
             return redirect(url_for('timetable.view_timetable'))
         
         # Create summary data
+        capacity = analytics['capacity']
         summary_data = {
-            'Total Classes': len(entries),
-            'Manual Adjustments': len([e for e in entries if e.is_manual]),
-            'Automatic Assignments': len([e for e in entries if not e.is_manual]),
+            'Total Classes': analytics['total_classes'],
+            'Manual Adjustments': analytics['manual_classes'],
+            'Automatic Assignments': analytics['automatic_classes'],
+            'Scheduled Hours': analytics['scheduled_hours'],
+            'Room-Hour Utilization (%)': analytics['utilization_percent'],
+            'Seats Offered': capacity['seats_offered'],
+            'Seats Used': capacity['seats_used'],
+            'Seat Utilization (%)': capacity['seat_utilization_percent'],
+            'Average Empty Seats': capacity['average_empty_seats'],
+            'Classes Over Capacity': capacity['over_capacity_classes'],
         }
         
-        # Room utilization
-        room_usage = {}
-        for entry in entries:
-            room_name = entry.room.name
-            room_usage[room_name] = room_usage.get(room_name, 0) + 1
-        
-        # Teacher workload
-        teacher_workload = {}
-        for entry in entries:
-            teacher_name = entry.teacher.name
-            teacher_workload[teacher_name] = teacher_workload.get(teacher_name, 0) + 1
-        
-        # Create summary DataFrame
+        # Create summary DataFrames
         summary_df = pd.DataFrame(list(summary_data.items()), columns=['Metric', 'Value'])
-        room_df = pd.DataFrame(list(room_usage.items()), columns=['Room', 'Classes Scheduled'])
-        teacher_df = pd.DataFrame(list(teacher_workload.items()), columns=['Teacher', 'Classes Assigned'])
+        room_df = pd.DataFrame([
+            [room['name'], room['capacity'], room['classes'], room['hours'], room['utilization_percent'],
+             room['seat_utilization_percent'], room['average_empty_seats']]
+            for room in analytics['rooms']
+        ], columns=['Room', 'Capacity', 'Classes Scheduled', 'Hours', 'Utilization (%)',
+                    'Seat Utilization (%)', 'Average Empty Seats'])
+        teacher_df = pd.DataFrame([
+            [teacher['name'], teacher['classes'], teacher['hours'], teacher['max_hours'], teacher['load_percent']]
+            for teacher in analytics['teachers']
+        ], columns=['Teacher', 'Classes Assigned', 'Hours', 'Max Hours', 'Load (%)'])
+        day_df = pd.DataFrame([
+            [day['day'], day['classes'], day['hours'], day['utilization_percent']]
+            for day in analytics['days']
+        ], columns=['Day', 'Classes', 'Hours', 'Room-Hour Utilization (%)'])
+        sheets = {
+            'Summary': summary_df,
+            'Room Utilization': room_df,
+            'Teacher Workload': teacher_df,
+            'Daily Load': day_df
+        }
         
         # Create Excel file with multiple sheets
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-            room_df.to_excel(writer, sheet_name='Room Utilization', index=False)
-            teacher_df.to_excel(writer, sheet_name='Teacher Workload', index=False)
+            workbook = writer.book
+            header_format = workbook.add_format({
+                'bold': True,
+                'text_wrap': True,
+                'valign': 'top',
+                'fg_color': '#D7E4BC',
+                'border': 1
+            })
             
-            # Format sheets
-            for sheet_name in ['Summary', 'Room Utilization', 'Teacher Workload']:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
                 worksheet = writer.sheets[sheet_name]
-                workbook = writer.book
-                
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#D7E4BC',
-                    'border': 1
-                })
                 
                 # Format headers
-                for col_num in range(2):  # Both sheets have 2 columns
-                    worksheet.write(0, col_num, worksheet.cell(0, col_num).value, header_format)
+                for col_num, value in enumerate(df.columns.values):
+                    worksheet.write(0, col_num, value, header_format)
                 
                 # Auto-adjust column widths
-                worksheet.set_column(0, 0, 20)
-                worksheet.set_column(1, 1, 15)
+                worksheet.set_column(0, 0, 25)
+                worksheet.set_column(1, len(df.columns) - 1, 15)
         
         output.seek(0)
         
@@ -250,7 +282,7 @@ def export_summary():
         response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         response.headers['Content-Disposition'] = f'attachment; filename=timetable_summary_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
         
-        return response
+        return with_validators(response, etag, version, EXPORT_CACHE_CONTROL)
         
     except Exception as e:
         logging.error(f"Summary export error: {e}")
@@ -1,52 +1,84 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, make_response, session
 from auth import login_required, role_required, get_current_user, get_user_institution_filter
-from models import TimetableEntry, Course, Teacher, Room, TimeSlot, Department
-from scheduler import generate_timetable_for_institution
+from models import TimetableEntry, Course, Teacher, Room, Department, GenerationJob
+from scheduler import STRATEGIES, submit_generation_job, find_active_job, request_job_stop, serialize_job
+from scheduler.persistence import bump_timetable_version, scoped_entries_query, timetable_version
+from utils.http_cache import PAGE_CACHE_CONTROL, not_modified, timetable_etag, with_validators
+from utils.timetable_cache import cached_timetable_view
+from utils.timetable_analytics import timetable_analytics
+from utils.timetable_queries import build_timetable_view, load_timeslots, load_timetable_entries, week_grid
 from app import db
 import logging
 
 timetable_bp = Blueprint('timetable', __name__)
 
+def _page_validators(user, institution_id, *scope, cacheable=True):
+    """Timetable version and ETag of a page for this user, no ETag when it can't be reused.
+    
+    Pages also show flash messages, which are not part of the version.
+    """
+    if not institution_id:
+        return None, None
+    version = timetable_version(institution_id)
+    if not cacheable or session.get('_flashes'):
+        return version, None
+    return version, timetable_etag(version, *scope, institution_id, user.id, user.role, session.get('user_role'))
+
+def _render_week(title, scope, **filters):
+    """One teacher's, room's or section's week, from a single indexed entry query"""
+    user = get_current_user()
+    institution_id = get_user_institution_filter().get('institution_id')
+    version, etag = _page_validators(user, institution_id, *scope)
+    if etag:
+        response = not_modified(etag, version, PAGE_CACHE_CONTROL)
+        if response:
+            return response
+    
+    entries = load_timetable_entries(institution_id, **filters)
+    html = render_template('timetable_week.html',
+                           title=title,
+                           timetable_entries=entries,
+                           timetable_grid=week_grid(load_timeslots(institution_id), entries),
+                           user=user)
+    response = make_response(html)
+    if etag:
+        with_validators(response, etag, version, PAGE_CACHE_CONTROL)
+    return response
+
 @timetable_bp.route('/')
 @login_required
 def view_timetable():
     user = get_current_user()
     user_filter = get_user_institution_filter()
     
-    # Get timetable entries
-    query = TimetableEntry.query
-    if user_filter:
-        query = query.filter_by(**user_filter)
-    
-    # Filter by department for faculty
-    if user.role == 'faculty' and user.department_id:
-        query = query.join(Course).filter(Course.department_id == user.department_id)
+    institution_id = user_filter.get('institution_id')
+    department_id = user.department_id if user.role == 'faculty' else None
     
-    timetable_entries = query.all()
-    
-    # Get time slots for display
-    timeslots_query = TimeSlot.query
-    if user_filter:
-        timeslots_query = timeslots_query.filter_by(**user_filter)
-    timeslots = timeslots_query.order_by(TimeSlot.day_of_week, TimeSlot.start_time).all()
+    # Show progress of a generation still running for this institution
+    active_job = None
+    if user.role in ['admin', 'faculty'] and user.institution_id:
+        active_job = find_active_job(
+            user.institution_id,
+            user.department_id if user.role == 'faculty' else None
+        )
     
-    # Organize timetable data for display
-    timetable_grid = {}
-    days_of_week = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    # The browser's copy stays valid until the timetable changes, unless
+    # the page also shows a running job
+    version, etag = _page_validators(user, institution_id, 'page', department_id, cacheable=not active_job)
+    if etag:
+        response = not_modified(etag, version, PAGE_CACHE_CONTROL)
+        if response:
+            return response
     
-    for entry in timetable_entries:
-        day = days_of_week[entry.timeslot.day_of_week]
-        time_key = f"{entry.timeslot.start_time.strftime('%H:%M')}-{entry.timeslot.end_time.strftime('%H:%M')}"
-        
-        if day not in timetable_grid:
-            timetable_grid[day] = {}
-        
-        timetable_grid[day][time_key] = {
-            'entry': entry,
-            'course': entry.course,
-            'teacher': entry.teacher,
-            'room': entry.room
-        }
+    # The grid, analytics and subject summary only change with the
+    # timetable, so they are cached per timetable version
+    if version:
+        view = cached_timetable_view(
+            institution_id, department_id, version,
+            lambda: build_timetable_view(institution_id, department_id)
+        )
+    else:
+        view = build_timetable_view(None, department_id)
     
     # Get departments for admin/faculty
     departments = []
@@ -56,34 +88,40 @@ def view_timetable():
             departments_query = departments_query.filter_by(**user_filter)
         departments = departments_query.all()
     
-    # Generate analytics
-    total_periods = len(timeslots) * 6  # 6 working days
-    scheduled_periods = len(timetable_entries)
-    utilization_percent = round((scheduled_periods / total_periods * 100) if total_periods > 0 else 0, 1)
-    
-    analytics = {
-        'total_periods': total_periods,
-        'scheduled_periods': scheduled_periods,
-        'utilization_percent': utilization_percent
-    }
-    
-    # Get unique courses for subject summary
-    courses_query = Course.query
-    if user_filter:
-        courses_query = courses_query.filter_by(**user_filter)
-    subject_summary = courses_query.all()
-    
-    return render_template('timetable_display.html', 
-                         timetable_entries=timetable_entries,
-                         periods=timeslots,
-                         timetable_grid=timetable_grid,
-                         days_of_week=days_of_week,
+    html = render_template('timetable_display.html', 
+                         timetable_entries=view['entries'],
+                         timetable_grid=view['grid'],
                          departments=departments,
                          user=user,
                          section_name="Current Timetable",
                          academic_year="2025-2026",
-                         analytics=analytics,
-                         subject_summary=subject_summary)
+                         analytics=view['analytics'],
+                         subject_summary=view['subject_summary'],
+                         active_job=active_job)
+    response = make_response(html)
+    if etag:
+        with_validators(response, etag, version, PAGE_CACHE_CONTROL)
+    return response
+
+@timetable_bp.route('/teacher/<int:teacher_id>')
+@login_required
+def teacher_week(teacher_id):
+    teacher = Teacher.query.filter_by(id=teacher_id, **get_user_institution_filter()).first_or_404()
+    return _render_week(teacher.name, ('teacher', teacher_id), teacher_id=teacher_id)
+
+@timetable_bp.route('/room/<int:room_id>')
+@login_required
+def room_week(room_id):
+    room = Room.query.filter_by(id=room_id, **get_user_institution_filter()).first_or_404()
+    return _render_week(f"{room.name} ({room.code})", ('room', room_id), room_id=room_id)
+
+@timetable_bp.route('/course/<int:course_id>')
+@timetable_bp.route('/course/<int:course_id>/section/<section>')
+@login_required
+def course_week(course_id, section=None):
+    course = Course.query.filter_by(id=course_id, **get_user_institution_filter()).first_or_404()
+    title = f"{course.code} - {course.name}" + (f", section {section}" if section else '')
+    return _render_week(title, ('course', course_id, section), course_id=course_id, section=section)
 
 @timetable_bp.route('/generate', methods=['POST'])
 @login_required
@@ -91,6 +129,8 @@ def view_timetable():
 def generate_timetable():
     user = get_current_user()
     department_id = request.form.get('department_id')
+    strategy = request.form.get('strategy')
+    incremental = request.form.get('mode') == 'incremental'
     
     if not user.institution_id:
         flash('You must be associated with an institution to generate timetables.', 'error')
@@ -101,27 +141,56 @@ def generate_timetable():
         department_id = user.department_id
     
     try:
-        result = generate_timetable_for_institution(
-            user.institution_id, 
-            int(department_id) if department_id else None
+        job = submit_generation_job(
+            user.institution_id,
+            int(department_id) if department_id else None,
+            requested_by=user.id,
+            strategy=strategy if strategy in STRATEGIES else None,
+            incremental=incremental
         )
         
-        if result['success']:
-            flash(result['message'], 'success')
-            if result['conflicts']:
-                for conflict in result['conflicts']:
-                    flash(f"Warning: {conflict}", 'warning')
-        else:
-            flash(result['message'], 'error')
-            for conflict in result.get('conflicts', []):
-                flash(f"Conflict: {conflict}", 'warning')
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(serialize_job(job)), 202
+        
+        flash('Timetable generation started. This page will update when it finishes.', 'info')
                 
     except Exception as e:
         logging.error(f"Timetable generation error: {e}")
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': 'Failed to start timetable generation.'}), 500
         flash('Failed to generate timetable. Please try again.', 'error')
     
     return redirect(url_for('timetable.view_timetable'))
 
+@timetable_bp.route('/jobs/<int:job_id>')
+@login_required
+@role_required('admin', 'faculty')
+def job_status(job_id):
+    user = get_current_user()
+    job = GenerationJob.query.get_or_404(job_id)
+    
+    if job.institution_id != user.institution_id:
+        return jsonify({'error': 'Job not found.'}), 404
+    
+    return jsonify(serialize_job(job))
+
+@timetable_bp.route('/jobs/<int:job_id>/accept', methods=['POST'])
+@login_required
+@role_required('admin', 'faculty')
+def accept_job_solution(job_id):
+    """Stop a running generation and keep the best timetable found so far"""
+    user = get_current_user()
+    job = GenerationJob.query.get_or_404(job_id)
+    
+    if job.institution_id != user.institution_id:
+        return jsonify({'error': 'Job not found.'}), 404
+    
+    if not request_job_stop(job.id):
+        return jsonify({'error': 'Job has already finished.'}), 409
+    
+    db.session.refresh(job)
+    return jsonify(serialize_job(job))
+
 @timetable_bp.route('/clear', methods=['POST'])
 @login_required
 @role_required('admin', 'faculty')
@@ -134,14 +203,13 @@ def clear_timetable():
         return redirect(url_for('timetable.view_timetable'))
     
     try:
-        query = TimetableEntry.query.filter_by(institution_id=user.institution_id)
-        
         # Faculty can only clear their department
+        dept_id = None
         if user.role == 'faculty' or department_id:
             dept_id = user.department_id if user.role == 'faculty' else int(department_id)
-            query = query.join(Course).filter(Course.department_id == dept_id)
         
-        deleted_count = query.delete(synchronize_session=False)
+        deleted_count = scoped_entries_query(user.institution_id, dept_id).delete(synchronize_session=False)
+        bump_timetable_version(user.institution_id)
         db.session.commit()
         
         flash(f'Cleared {deleted_count} timetable entries.', 'success')
@@ -163,39 +231,11 @@ def analytics():
         flash('You must be associated with an institution.', 'error')
         return redirect(url_for('timetable.view_timetable'))
     
-    # Get timetable entries for analytics
-    query = TimetableEntry.query.filter_by(institution_id=user.institution_id)
-    if user.role == 'faculty' and user.department_id:
-        query = query.join(Course).filter(Course.department_id == user.department_id)
-    
-    entries = query.all()
-    
-    # Calculate analytics
-    room_utilization = {}
-    teacher_workload = {}
-    
-    for entry in entries:
-        # Room utilization
-        room_name = entry.room.name
-        if room_name not in room_utilization:
-            room_utilization[room_name] = 0
-        room_utilization[room_name] += 1
-        
-        # Teacher workload
-        teacher_name = entry.teacher.name
-        if teacher_name not in teacher_workload:
-            teacher_workload[teacher_name] = 0
-        teacher_workload[teacher_name] += 1
-    
-    # Get total available slots for utilization calculation
-    total_timeslots = TimeSlot.query.filter_by(institution_id=user.institution_id).count()
-    
-    analytics_data = {
-        'total_classes': len(entries),
-        'room_utilization': room_utilization,
-        'teacher_workload': teacher_workload,
-        'total_timeslots': total_timeslots
-    }
+    # Counts, hours and utilisation aggregated by the database
+    analytics_data = timetable_analytics(
+        user.institution_id,
+        user.department_id if user.role == 'faculty' else None
+    )
     
     return render_template('analytics.html', analytics=analytics_data)
 
@@ -1,3 +1,9 @@
-from .timetable_engine import TimetableScheduler, generate_timetable_for_institution
+from .timetable_engine import TimetableScheduler
+from .decomposition import DepartmentDecomposer
+from .lns import LnsScheduler
+from .strategies import STRATEGIES, create_scheduler, generate_timetable_for_institution
+from .jobs import submit_generation_job, find_active_job, request_job_stop, serialize_job
 
-__all__ = ['TimetableScheduler', 'generate_timetable_for_institution']
+__all__ = ['TimetableScheduler', 'DepartmentDecomposer', 'LnsScheduler', 'STRATEGIES', 'create_scheduler',
+           'generate_timetable_for_institution',
+           'submit_generation_job', 'find_active_job', 'request_job_stop', 'serialize_job']
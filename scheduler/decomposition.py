@@ -0,0 +1,369 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
+from typing import Any, Dict, List, Set, Tuple
+from .settings import SolverSettings
+from .snapshot import SchedulingSnapshot, room_suits_course
+from .timetable_engine import TimetableScheduler
+import logging
+import os
+import threading
+import time
+
+# Share of the solve time limit the first pass may use. The rest is left for
+# re-solving departments that failed under their room allocation
+FIRST_PASS_SHARE = float(os.environ.get('TIMETABLE_DECOMPOSITION_FIRST_PASS_SHARE', '0.6'))
+
+RoomSlot = Tuple[int, int]
+
+
+def _room_runs(snapshot: SchedulingSnapshot, length: int) -> List[List[int]]:
+    """Split the week into runs of `length` periods a block can use, single periods where none fits"""
+    blocks = snapshot.blocks(length)
+    runs, taken = [], set()
+    for timeslot in snapshot.timeslots:
+        if timeslot.id in taken:
+            continue
+        covered = blocks.get(timeslot.id, [timeslot.id])
+        if any(slot_id in taken for slot_id in covered):
+            covered = [timeslot.id]
+        runs.append(covered)
+        taken.update(covered)
+    return runs
+
+
+def allocate_room_slots(snapshot: SchedulingSnapshot, available: Set[RoomSlot] = None) -> Dict[int, Set[RoomSlot]]:
+    """Split shared room capacity between departments in proportion to demand.
+
+    A department's demand for a room is the fractional share of its courses'
+    weekly periods that could use the room. Each room's week is cut into
+    runs as long as the longest block of a course that fits the room, and
+    the runs are dealt out in turn to the department furthest below its
+    share. Every department gets capacity spread over the whole week, in
+    runs its blocks can be placed in. available limits the allocation to
+    those room/timeslot pairs.
+    """
+    departments = snapshot.department_ids()
+    demand = {department_id: {} for department_id in departments}
+    run_length = {}
+    for course in snapshot.courses:
+        suitable = [room for room in snapshot.rooms if room_suits_course(course, room)]
+        for room in suitable:
+            room_demand = demand[course.department_id]
+            periods = course.sessions * course.block_length
+            room_demand[room.id] = room_demand.get(room.id, 0.0) + periods / len(suitable)
+            run_length[room.id] = max(run_length.get(room.id, 1), course.block_length)
+
+    runs_by_length = {length: _room_runs(snapshot, length) for length in set(run_length.values())}
+    allocation = {department_id: set() for department_id in departments}
+    for room in snapshot.rooms:
+        weights = {d: demand[d][room.id] for d in departments if demand[d].get(room.id)}
+        if not weights:
+            continue
+        total = sum(weights.values())
+        given = {department_id: 0 for department_id in weights}
+        dealt = 0
+        for run in runs_by_length[run_length[room.id]]:
+            if available is not None:
+                run = [timeslot_id for timeslot_id in run if (room.id, timeslot_id) in available]
+                if not run:
+                    continue
+            dealt += len(run)
+            owner = max(weights, key=lambda d: weights[d] / total * dealt - given[d])
+            given[owner] += len(run)
+            allocation[owner].update((room.id, timeslot_id) for timeslot_id in run)
+    return allocation
+
+
+def repair_room_conflicts(entries: List[Dict], snapshot: SchedulingSnapshot) -> Tuple[List[Dict], List[str]]:
+    """Move meetings that double-book a room to a free suitable room.
+
+    The periods of a meeting are consecutive in entries, as the solver
+    produces them, and a meeting only moves as a whole: all its periods go to
+    one room that is free for all of them, or it stays unresolved. Another
+    room in the same timeslots is tried first, then, for courses meeting
+    once a week, any block the teacher is free in. Courses meeting more than
+    once a week keep their timeslots so meetings stay on their day. Returns
+    the repaired entries and the conflicts that could not be resolved.
+    """
+    courses = {course.id: course for course in snapshot.courses}
+    meetings = []
+    for entry in entries:
+        previous = meetings[-1] if meetings else None
+        if (previous and len(previous) < courses[entry['course_id']].block_length
+                and all(previous[0][key] == entry[key] for key in ('course_id', 'teacher_id', 'room_id'))):
+            previous.append(entry)
+        else:
+            meetings.append([entry])
+
+    occupied = set(snapshot.blocked)
+    teacher_busy = set()
+    clashing = []
+    for meeting in meetings:
+        room_slots = {(entry['room_id'], entry['timeslot_id']) for entry in meeting}
+        if room_slots & occupied:
+            clashing.append(meeting)
+            continue
+        occupied.update(room_slots)
+        teacher_busy.update((entry['teacher_id'], entry['timeslot_id']) for entry in meeting)
+
+    blocks_by_length = {}
+    unresolved = []
+    for meeting in clashing:
+        course = courses[meeting[0]['course_id']]
+        teacher_id = meeting[0]['teacher_id']
+        rooms = [room for room in snapshot.rooms if room_suits_course(course, room)]
+        unavailable = snapshot.unavailable.get(teacher_id, set())
+        candidates = [[entry['timeslot_id'] for entry in meeting]]
+        if course.sessions == 1:
+            if course.block_length not in blocks_by_length:
+                blocks_by_length[course.block_length] = snapshot.blocks(course.block_length)
+            candidates += [
+                covered for covered in blocks_by_length[course.block_length].values()
+                if covered != candidates[0] and not any(
+                    slot_id in unavailable or (teacher_id, slot_id) in teacher_busy for slot_id in covered
+                )
+            ]
+        target = next(((room.id, covered) for covered in candidates for room in rooms
+                       if not any((room.id, slot_id) in occupied for slot_id in covered)), None)
+        if target is None:
+            unresolved.append(f"Course {course.name} could not be moved out of a room double-booking")
+            continue
+        room_id, covered = target
+        for entry, timeslot_id in zip(meeting, covered):
+            entry['room_id'], entry['timeslot_id'] = room_id, timeslot_id
+            occupied.add((room_id, timeslot_id))
+            teacher_busy.add((teacher_id, timeslot_id))
+    return entries, unresolved
+
+
+def merge_objectives(objectives: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add up the objective breakdowns of the department sub-models"""
+    terms = {}
+    for objective in objectives:
+        for name, term in objective['terms'].items():
+            merged = terms.setdefault(name, {'weight': term['weight'], 'value': 0, 'weighted': 0})
+            merged['value'] += term['value']
+            merged['weighted'] += term['weighted']
+    return {
+        'total': sum(objective['total'] for objective in objectives),
+        'best_bound': sum(objective['best_bound'] for objective in objectives),
+        'terms': terms
+    }
+
+
+class DepartmentDecomposer(TimetableScheduler):
+    """Institution-wide generation solved as one sub-model per department.
+
+    Teachers only teach within their own department, so departments only
+    interact through shared rooms. Room capacity is pre-allocated to each
+    department, the sub-models are solved in parallel, departments that fail
+    under their allocation are re-solved against the capacity the others
+    left unused, and a final pass repairs any remaining room clash.
+    """
+
+    def __init__(self, institution_id: int, settings: SolverSettings = None, on_progress=None):
+        super().__init__(institution_id, settings, on_progress)
+        self._running = []
+        self._lock = threading.Lock()
+        self._progress = []
+
+    def request_stop(self):
+        """Stop every department solve, keeping the best solution each has found so far"""
+        with self._lock:
+            self.stop_requested = True
+            running = list(self._running)
+        for scheduler in running:
+            scheduler.request_stop()
+
+    def _solve_department(self, snapshot: SchedulingSnapshot, settings: SolverSettings,
+                          deadline: float, explain_failures: bool) -> Dict[str, Any]:
+        """Worker thread entry point: solve one department's sub-model from its snapshot.
+
+        deadline is the time.perf_counter() by which the solve must end, None
+        for no limit.
+        """
+        if deadline is not None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return {'success': False, 'message': 'No solve time was left for this department.', 'conflicts': []}
+            settings = replace(settings, max_time_seconds=max(0.1, round(remaining, 1)))
+        scheduler = TimetableScheduler(self.institution_id, settings)
+        scheduler.explain_failures = explain_failures
+        with self._lock:
+            if self.stop_requested:
+                return {'success': False, 'message': 'Generation was stopped before this department was solved.',
+                        'conflicts': []}
+            self._running.append(scheduler)
+        try:
+            result = scheduler.solve_snapshot(snapshot)
+        finally:
+            with self._lock:
+                self._running.remove(scheduler)
+        result['department_id'] = snapshot.department_id
+        return result
+
+    def solve_snapshot(self, snapshot: SchedulingSnapshot, incremental: bool = False) -> Dict[str, Any]:
+        # Incremental runs only re-solve a small neighbourhood and need no split
+        departments = snapshot.department_ids()
+        if incremental or snapshot.is_empty() or snapshot.department_id or len(departments) < 2:
+            return super().solve_snapshot(snapshot, incremental)
+
+        if self.settings is None:
+            self.settings = SolverSettings.from_rules(snapshot.rules)
+
+        screening = self._screen(snapshot)
+        if screening:
+            return screening
+
+        with self._timed('allocate'):
+            allocation = allocate_room_slots(snapshot)
+            all_pairs = {(room.id, ts.id) for room in snapshot.rooms for ts in snapshot.timeslots}
+            subproblems = {
+                department_id: snapshot.for_department(department_id, all_pairs - allocation[department_id])
+                for department_id in departments
+            }
+
+        # The first pass leaves part of the time limit for re-solving failed
+        # departments, so the whole run stays within the limit
+        limit = self.settings.max_time_seconds
+        started = time.perf_counter()
+        deadline = started + limit if limit > 0 else None
+        with self._timed('solve'):
+            # A first pass failure usually comes from the room allocation and
+            # is not worth explaining
+            results = self._solve_in_parallel(
+                subproblems, started + limit * FIRST_PASS_SHARE if deadline else None, explain_failures=False
+            )
+            retried = self._renegotiate(snapshot, results, deadline)
+
+        self.stats['departments'] = {
+            department_id: {
+                'success': result['success'],
+                'message': result['message'],
+                'retried': department_id in retried,
+                'variable_count': result.get('stats', {}).get('variable_count', 0),
+                'constraint_count': result.get('stats', {}).get('constraint_count', 0),
+                'timings': result.get('stats', {}).get('timings', {}),
+                'solver': result.get('stats', {}).get('solver'),
+                'objective': result.get('stats', {}).get('objective')
+            }
+            for department_id, result in results.items()
+        }
+        self.stats['variable_count'] = sum(d['variable_count'] for d in self.stats['departments'].values())
+        self.stats['constraint_count'] = sum(d['constraint_count'] for d in self.stats['departments'].values())
+        self.stats['session_count'] = sum(course.sessions for course in snapshot.courses)
+        objectives = [d['objective'] for d in self.stats['departments'].values() if d['objective']]
+        if objectives:
+            self.stats['objective'] = merge_objectives(objectives)
+
+        failed = [result for result in results.values() if not result['success']]
+        if failed:
+            conflicts = []
+            for result in failed:
+                conflicts.append(result['message'])
+                conflicts.extend(result.get('conflicts', []))
+            return {
+                'success': False,
+                'message': f'Could not generate a feasible timetable for {len(failed)} of {len(departments)} departments.',
+                'conflicts': conflicts,
+                'stats': self.stats
+            }
+
+        entries = [entry for result in results.values() for entry in result['entries']]
+        with self._timed('repair'):
+            entries, unresolved = repair_room_conflicts(entries, snapshot)
+        if unresolved:
+            return {
+                'success': False,
+                'message': 'Department timetables could not be merged without room conflicts.',
+                'conflicts': unresolved,
+                'stats': self.stats
+            }
+
+        message = f'Timetable generated successfully with {len(entries)} classes scheduled across {len(departments)} departments.'
+        self.stats['pinned'] = snapshot.pinned_count()
+        if self.stats['pinned']:
+            message += f" {self.stats['pinned']} manually placed classes were kept."
+        return {
+            'success': True,
+            'message': message,
+            'conflicts': self.conflicts,
+            'entries_count': len(entries),
+            'entries': entries,
+            'stats': self.stats
+        }
+
+    def _solve_in_parallel(self, subproblems: Dict[int, SchedulingSnapshot], deadline: float,
+                           explain_failures: bool = True,
+                           results: Dict[int, Dict[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        """Solve every department sub-model at once, sharing the solver workers between them.
+
+        None waits for another to finish, so all of them end by the deadline.
+        Threads are enough since CP-SAT releases the GIL while solving, and
+        unlike forked processes they can be told to stop.
+        """
+        workers = len(subproblems)
+        total_search_workers = self.settings.num_workers or os.cpu_count() or 1
+        sub_settings = replace(self.settings, num_workers=max(1, total_search_workers // workers))
+
+        results = {} if results is None else results
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self._solve_department, subproblem, sub_settings, deadline, explain_failures): department_id
+                for department_id, subproblem in subproblems.items()
+            }
+            for future in as_completed(futures):
+                department_id = futures[future]
+                try:
+                    results[department_id] = future.result()
+                except Exception as e:
+                    logging.error(f"Department {department_id} solve error: {e}")
+                    results[department_id] = {
+                        'success': False, 'message': f'Error solving department {department_id}: {str(e)}',
+                        'conflicts': []
+                    }
+                self._report_department(department_id, results, started)
+        return results
+
+    def _renegotiate(self, snapshot: SchedulingSnapshot, results: Dict[int, Dict[str, Any]],
+                     deadline: float) -> List[int]:
+        """Retry failed departments in parallel on the room capacity the solved ones left free.
+
+        The free capacity is split between the failed departments like the
+        first allocation, and the retries only get what is left of the time
+        limit.
+        """
+        failed = [department_id for department_id, result in results.items() if not result['success']]
+        if not failed or self.stop_requested or (deadline is not None and deadline <= time.perf_counter()):
+            return []
+
+        all_pairs = {(room.id, ts.id) for room in snapshot.rooms for ts in snapshot.timeslots}
+        used = {
+            (entry['room_id'], entry['timeslot_id'])
+            for result in results.values() if result['success']
+            for entry in result['entries']
+        }
+        failed_snapshot = replace(snapshot, courses=[c for c in snapshot.courses if c.department_id in failed])
+        allocation = allocate_room_slots(failed_snapshot, all_pairs - used - snapshot.blocked)
+        self._solve_in_parallel({
+            department_id: snapshot.for_department(department_id, all_pairs - allocation[department_id])
+            for department_id in failed
+        }, deadline, results=results)
+        return failed
+
+    def _report_department(self, department_id: int, results: Dict[int, Dict[str, Any]], started: float):
+        """Publish progress each time a department finishes"""
+        if not self.on_progress:
+            return
+        placed = sum(result.get('entries_count', 0) for result in results.values() if result['success'])
+        self._progress.append({
+            'solution': len(self._progress) + 1,
+            'objective': None,
+            'best_bound': None,
+            'wall_time': round(time.perf_counter() - started, 3),
+            'timestamp': time.time(),
+            'placed': placed,
+            'department_id': department_id
+        })
+        self.on_progress(self._progress[-1], self._progress)
@@ -0,0 +1,112 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .snapshot import SchedulingSnapshot, room_suits_course
+
+Assignment = Tuple[int, int, int]  # (teacher_id, room_id, timeslot_id)
+
+
+def _stored_blocks(assignments: List[Assignment], blocks: Dict[int, List[int]],
+                   positions: Dict[int, int]) -> Optional[List[Assignment]]:
+    """Split a course's stored periods into meeting blocks, keyed by starting timeslot.
+
+    Returns None when the periods do not form whole blocks of the course's
+    length in one room with one teacher.
+    """
+    remaining = sorted(assignments, key=lambda assignment: positions.get(assignment[2], -1))
+    starts = []
+    while remaining:
+        teacher_id, room_id, start_id = remaining[0]
+        covered = blocks.get(start_id)
+        if covered is None:
+            return None
+        block = [(teacher_id, room_id, timeslot_id) for timeslot_id in covered]
+        if remaining[:len(block)] != block:
+            return None
+        starts.append(remaining[0])
+        remaining = remaining[len(block):]
+    return starts
+
+
+def valid_current_assignments(snapshot: SchedulingSnapshot) -> Dict[int, List[Assignment]]:
+    """Stored meetings, by course, that still satisfy every hard constraint.
+
+    A course's stored timetable is dropped as a whole when it no longer has
+    the required number of meetings in whole blocks with one teacher, its
+    teacher, room or timeslot is gone, the teacher is no longer available,
+    the room no longer suits the course or it clashes with a course kept
+    before it.
+    """
+    teachers = {teacher.id: teacher for teacher in snapshot.teachers}
+    rooms = {room.id: room for room in snapshot.rooms}
+    positions = {timeslot.id: position for position, timeslot in enumerate(snapshot.timeslots)}
+    blocks_by_length = {length: snapshot.blocks(length)
+                        for length in {course.block_length for course in snapshot.courses}}
+    taken_rooms = set(snapshot.blocked)
+    taken_teachers = set()
+
+    kept = {}
+    for course in snapshot.courses:
+        assignments = snapshot.current.get(course.id)
+        if not assignments:
+            continue
+        blocks = blocks_by_length[course.block_length]
+        starts = _stored_blocks(assignments, blocks, positions)
+        if not starts or len(starts) != course.sessions:
+            continue
+        teacher = teachers.get(starts[0][0])
+        if teacher is None or teacher.department_id != course.department_id:
+            continue
+        if any(teacher_id != teacher.id for teacher_id, _, _ in starts):
+            continue
+        if any(room_id not in rooms or not room_suits_course(course, rooms[room_id]) for _, room_id, _ in starts):
+            continue
+
+        periods = [(room_id, timeslot_id) for _, room_id, start_id in starts for timeslot_id in blocks[start_id]]
+        unavailable = snapshot.unavailable.get(teacher.id, ())
+        if len({timeslot_id for _, timeslot_id in periods}) < len(periods):
+            continue
+        if any(
+            timeslot_id in unavailable or (room_id, timeslot_id) in taken_rooms
+            or (teacher.id, timeslot_id) in taken_teachers
+            for room_id, timeslot_id in periods
+        ):
+            continue
+        kept[course.id] = starts
+        taken_rooms.update(periods)
+        taken_teachers.update((teacher.id, timeslot_id) for _, timeslot_id in periods)
+    return kept
+
+
+def neighbourhoods(snapshot: SchedulingSnapshot, kept: Dict[int, List[Assignment]],
+                   changed_course_ids: Iterable[int] = ()) -> List[Set[int]]:
+    """Growing sets of courses to re-solve while everything else stays put.
+
+    The first set holds the courses that lost a valid assignment plus the
+    other classes of their teachers, the second widens to their whole
+    departments and the last frees every course.
+    """
+    affected = {course.id for course in snapshot.courses if course.id not in kept}
+    affected.update(changed_course_ids)
+
+    teacher_ids = {snapshot.current[course_id][0][0] for course_id in affected if snapshot.current.get(course_id)}
+    local = affected | {course_id for course_id, starts in kept.items() if starts[0][0] in teacher_ids}
+
+    department_ids = {course.department_id for course in snapshot.courses if course.id in affected}
+    departments = {course.id for course in snapshot.courses if course.department_id in department_ids}
+
+    everything = {course.id for course in snapshot.courses}
+
+    stages = []
+    for courses in (local, local | departments, everything):
+        if not stages or courses != stages[-1]:
+            stages.append(courses)
+    return stages
+
+
+def count_moves(entries: List[Dict], current: Dict[int, List[Assignment]]) -> int:
+    """Number of periods of stored courses placed somewhere they were not before"""
+    stored = {course_id: set(assignments) for course_id, assignments in current.items()}
+    return sum(
+        1 for entry in entries
+        if entry['course_id'] in stored
+        and (entry['teacher_id'], entry['room_id'], entry['timeslot_id']) not in stored[entry['course_id']]
+    )
@@ -0,0 +1,276 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from flask import Flask, current_app
+from sqlalchemy.exc import IntegrityError
+from models import GenerationJob
+from app import db
+import logging
+import os
+import socket
+import threading
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Jobs that have not been touched for this long are considered orphaned by a
+# dead worker process and are queued again
+STALE_AFTER_SECONDS = int(os.environ.get('TIMETABLE_JOB_STALE_SECONDS', '900'))
+MAX_WORKERS = int(os.environ.get('TIMETABLE_JOB_WORKERS', '2'))
+
+# How often a running job publishes solver progress and checks for an early stop
+MONITOR_INTERVAL_SECONDS = 1.0
+PROGRESS_HISTORY_LIMIT = 50
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='timetable-job')
+        return _executor
+
+
+def _touch(job_id: int, **values):
+    """Update a job row and its heartbeat, committing immediately"""
+    values['updated_at'] = datetime.utcnow()
+    GenerationJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def serialize_job(job: GenerationJob) -> Dict[str, Any]:
+    """JSON-friendly view of a job for the status endpoint"""
+    return {
+        'id': job.id,
+        'institution_id': job.institution_id,
+        'department_id': job.department_id,
+        'strategy': job.strategy,
+        'incremental': bool(job.incremental),
+        'status': job.status,
+        'message': job.message,
+        'result': job.result,
+        'progress': job.progress or [],
+        'stop_requested': bool(job.stop_requested),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'done': job.status not in ACTIVE_STATUSES
+    }
+
+
+def find_active_job(institution_id: int, department_id: int = None) -> Optional[GenerationJob]:
+    """Return the queued or running job for an institution/department, if any"""
+    return GenerationJob.query.filter(
+        GenerationJob.institution_id == institution_id,
+        GenerationJob.department_id == department_id,
+        GenerationJob.status.in_(ACTIVE_STATUSES)
+    ).order_by(GenerationJob.id.desc()).first()
+
+
+def submit_generation_job(institution_id: int, department_id: int = None,
+                          requested_by: int = None, strategy: str = None,
+                          incremental: bool = False) -> GenerationJob:
+    """Queue a timetable generation, reusing an identical job already in flight.
+
+    A unique index allows one queued or running job per institution and
+    department, so requests racing past the lookup share the first job.
+    """
+    recover_stale_jobs()
+    existing = find_active_job(institution_id, department_id)
+    if existing:
+        return existing
+
+    job = GenerationJob(
+        institution_id=institution_id,
+        department_id=department_id,
+        requested_by=requested_by,
+        strategy=strategy,
+        incremental=incremental,
+        status='queued',
+        message='Waiting for a free scheduler worker.'
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return find_active_job(institution_id, department_id)
+
+    _get_executor().submit(_run_job, current_app._get_current_object(), job.id)
+    return job
+
+
+def request_job_stop(job_id: int) -> bool:
+    """Ask a running job to stop searching and keep its best solution so far"""
+    updated = GenerationJob.query.filter(
+        GenerationJob.id == job_id,
+        GenerationJob.status.in_(ACTIVE_STATUSES)
+    ).update({'stop_requested': True}, synchronize_session=False)
+    db.session.commit()
+    return bool(updated)
+
+
+class _JobMonitor(threading.Thread):
+    """Publish a running job's solver progress and relay stop requests.
+    
+    Solution callbacks fire on CP-SAT's own threads, outside any app context,
+    so they only hand records over in memory. This thread writes them to the
+    job row, which also serves as the job's heartbeat, and stops the search
+    when someone accepted the current best solution, from any web process.
+    """
+    
+    def __init__(self, app: Flask, job_id: int):
+        super().__init__(name=f'timetable-job-{job_id}-monitor', daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.scheduler = None
+        self.history = []
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+    
+    def record(self, record: Dict[str, Any], history: List[Dict[str, Any]]):
+        with self._lock:
+            self.history = history[-PROGRESS_HISTORY_LIMIT:]
+            self._dirty = True
+    
+    def finish(self):
+        self._done.set()
+        self.join()
+    
+    def run(self):
+        while not self._done.wait(MONITOR_INTERVAL_SECONDS):
+            self._sync()
+    
+    def _sync(self):
+        with self._lock:
+            history = list(self.history) if self._dirty else None
+            self._dirty = False
+        
+        with self.app.app_context():
+            try:
+                values = {}
+                if history:
+                    best = history[-1]
+                    values['progress'] = history
+                    values['message'] = (f"Found {best['solution']} solution(s) so far, "
+                                         f"{best['placed']} classes placed.")
+                _touch(self.job_id, **values)
+                
+                stop = db.session.query(GenerationJob.stop_requested).filter_by(id=self.job_id).scalar()
+                if stop and self.scheduler and not self.scheduler.stop_requested:
+                    self.scheduler.request_stop()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Timetable generation job {self.job_id} monitor error: {e}")
+
+
+def _start_next_job(app: Flask, institution_id: int):
+    """Hand the oldest queued job of an institution to the pool"""
+    next_job_id = db.session.query(GenerationJob.id).filter(
+        GenerationJob.institution_id == institution_id,
+        GenerationJob.status == 'queued'
+    ).order_by(GenerationJob.id).limit(1).scalar()
+    if next_job_id:
+        _get_executor().submit(_run_job, app, next_job_id)
+
+
+def _run_job(app: Flask, job_id: int):
+    """Claim a queued job and run the scheduler for it.
+
+    Jobs of one institution run one at a time: a unique index allows one
+    running job per institution, and a finished job starts the next one.
+    """
+    from .strategies import create_scheduler
+
+    with app.app_context():
+        # Claiming is a conditional update so a job is only ever run once,
+        # even when several processes try to pick it up
+        try:
+            claimed = GenerationJob.query.filter_by(id=job_id, status='queued').update({
+                'status': 'running',
+                'worker': f"{socket.gethostname()}:{os.getpid()}",
+                'message': 'Generating timetable.',
+                'started_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+        except IntegrityError:
+            # Another job of the institution is running and starts this one when done
+            db.session.rollback()
+            _touch(job_id, message='Waiting for another generation of this institution to finish.')
+            return
+        if not claimed:
+            return
+
+        job = db.session.get(GenerationJob, job_id)
+        monitor = _JobMonitor(app, job_id)
+        try:
+            scheduler = create_scheduler(job.institution_id, job.strategy, on_progress=monitor.record)
+            monitor.scheduler = scheduler
+            monitor.start()
+            result = scheduler.generate_timetable(job.department_id, bool(job.incremental))
+            monitor.finish()
+            _touch(
+                job_id,
+                status='succeeded' if result['success'] else 'failed',
+                message=result['message'][:500],
+                result=result,
+                progress=monitor.history,
+                finished_at=datetime.utcnow()
+            )
+        except Exception as e:
+            if monitor.is_alive():
+                monitor.finish()
+            db.session.rollback()
+            logging.error(f"Timetable generation job {job_id} error: {e}")
+            _touch(job_id, status='failed', message=f'Error generating timetable: {str(e)}'[:500],
+                   finished_at=datetime.utcnow())
+        _start_next_job(app, job.institution_id)
+
+
+def _worker_is_dead(worker: Optional[str]) -> bool:
+    """True if the job's worker process ran on this host and no longer exists"""
+    if not worker or ':' not in worker:
+        return False
+    host, pid = worker.rsplit(':', 1)
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def recover_stale_jobs():
+    """Re-queue jobs orphaned by a worker restart and hand them to the pool"""
+    app = current_app._get_current_object()
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER_SECONDS)
+    active_jobs = db.session.query(
+        GenerationJob.id, GenerationJob.status, GenerationJob.worker, GenerationJob.updated_at
+    ).filter(GenerationJob.status.in_(ACTIVE_STATUSES)).all()
+
+    for job_id, status, worker, updated_at in active_jobs:
+        orphaned = status == 'running' and _worker_is_dead(worker)
+        if not orphaned and (updated_at is None or updated_at >= cutoff):
+            continue
+        # Only requeue if nobody touched the job since we looked at it
+        requeued = GenerationJob.query.filter(
+            GenerationJob.id == job_id,
+            GenerationJob.status == status,
+            GenerationJob.updated_at == updated_at
+        ).update({
+            'status': 'queued',
+            'worker': None,
+            'message': 'Re-queued after a worker restart.',
+            'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        if requeued:
+            logging.info(f"Re-queued stale timetable generation job {job_id}")
+            _get_executor().submit(_run_job, app, job_id)
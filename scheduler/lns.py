@@ -0,0 +1,357 @@
+from dataclasses import replace
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .incremental import Assignment
+from .objective import ObjectiveWeights
+from .rules import SchedulingRules, break_pairs, lunch_windows, timeslots_by_day
+from .settings import SolverSettings
+from .snapshot import CourseData, RoomData, SchedulingSnapshot, TeacherData, room_suits_course
+from .timetable_engine import TimetableScheduler
+import math
+import os
+import random
+import time
+
+# Search budget of one LNS step, how many courses a step may free at most and
+# after how many steps without improvement the search gives up
+STEP_SECONDS = float(os.environ.get('TIMETABLE_LNS_STEP_SECONDS', '5'))
+MAX_FREE_COURSES = int(os.environ.get('TIMETABLE_LNS_MAX_FREE_COURSES', '150'))
+PATIENCE = int(os.environ.get('TIMETABLE_LNS_PATIENCE', '20'))
+
+
+class _Occupancy:
+    """Room and teacher time taken so far by the greedy assignment.
+
+    Checks the same hard constraints the CP-SAT model enforces, so a greedy
+    assignment can be fixed around an LNS neighbourhood without making the
+    step infeasible. Manually placed classes count as taken from the start.
+    """
+
+    def __init__(self, snapshot: SchedulingSnapshot, rules: SchedulingRules):
+        self.rules = rules
+        self.minutes = {ts.id: ts.minutes for ts in snapshot.timeslots}
+        self.day_of = {ts.id: ts.day_of_week for ts in snapshot.timeslots}
+        self.previous = {}
+        self.following = {}
+        self.lunch = {}
+        for day, day_slots in timeslots_by_day(snapshot).items():
+            for first, second in zip(day_slots, day_slots[1:]):
+                self.following[first.id] = second.id
+                self.previous[second.id] = first.id
+            if rules.lunch_break_minutes:
+                self.lunch[day] = lunch_windows(day_slots, rules)
+        self.contiguous = {tuple(pair) for pair in snapshot.blocks(2).values()}
+        self.breaks = set(break_pairs(snapshot, rules))
+        self.unavailable = snapshot.unavailable
+        self.rooms = set(snapshot.blocked)
+        self.busy = {}
+        self.weekly = {}
+        self.daily = {}
+        self.pinned = set()
+        for assignments in snapshot.pinned.values():
+            for teacher_id, room_id, timeslot_id in assignments:
+                self.take(teacher_id, room_id, [timeslot_id])
+                self.pinned.add((teacher_id, timeslot_id))
+
+    def load(self, teacher_id: int) -> int:
+        return self.weekly.get(teacher_id, 0)
+
+    def room_free(self, room_id: int, covered: List[int]) -> bool:
+        return not any((room_id, timeslot_id) in self.rooms for timeslot_id in covered)
+
+    def teacher_fits(self, teacher: TeacherData, covered: List[int]) -> bool:
+        """Whether the teacher can take a meeting over the covered timeslots"""
+        busy = self.busy.get(teacher.id, set())
+        unavailable = self.unavailable.get(teacher.id, ())
+        if any(timeslot_id in busy or timeslot_id in unavailable for timeslot_id in covered):
+            return False
+
+        rules = self.rules
+        minutes = sum(self.minutes[timeslot_id] for timeslot_id in covered)
+        weekly_cap = rules.weekly_minutes(teacher.max_hours_per_week)
+        if weekly_cap and self.weekly.get(teacher.id, 0) + minutes > weekly_cap:
+            return False
+        day = self.day_of[covered[0]]
+        if rules.max_hours_per_day and self.daily.get((teacher.id, day), 0) + minutes > int(rules.max_hours_per_day * 60):
+            return False
+
+        if rules.max_consecutive:
+            run = len(covered)
+            timeslot_id = covered[0]
+            while (self.previous.get(timeslot_id), timeslot_id) in self.contiguous and self.previous[timeslot_id] in busy:
+                timeslot_id = self.previous[timeslot_id]
+                run += 1
+            timeslot_id = covered[-1]
+            while (timeslot_id, self.following.get(timeslot_id)) in self.contiguous and self.following[timeslot_id] in busy:
+                timeslot_id = self.following[timeslot_id]
+                run += 1
+            if run > rules.max_consecutive:
+                return False
+
+        # The other side of each pair is outside the meeting, so any class there is a separate one
+        for pair in ((self.previous.get(covered[0]), covered[0]), (covered[-1], self.following.get(covered[-1]))):
+            if pair in self.breaks and (pair[0] in busy or pair[1] in busy):
+                return False
+
+        windows = [window for window in self.lunch.get(day) or ()
+                   if not any((teacher.id, timeslot_id) in self.pinned for timeslot_id in window)]
+        if windows and not any(
+            all(timeslot_id not in busy and timeslot_id not in covered for timeslot_id in window)
+            for window in windows
+        ):
+            return False
+        return True
+
+    def take(self, teacher_id: int, room_id: int, covered: List[int]):
+        minutes = sum(self.minutes[timeslot_id] for timeslot_id in covered)
+        day = self.day_of[covered[0]]
+        self.rooms.update((room_id, timeslot_id) for timeslot_id in covered)
+        self.busy.setdefault(teacher_id, set()).update(covered)
+        self.weekly[teacher_id] = self.weekly.get(teacher_id, 0) + minutes
+        self.daily[(teacher_id, day)] = self.daily.get((teacher_id, day), 0) + minutes
+
+    def release(self, teacher_id: int, room_id: int, covered: List[int]):
+        minutes = sum(self.minutes[timeslot_id] for timeslot_id in covered)
+        day = self.day_of[covered[0]]
+        self.rooms.difference_update((room_id, timeslot_id) for timeslot_id in covered)
+        self.busy[teacher_id].difference_update(covered)
+        self.weekly[teacher_id] -= minutes
+        self.daily[(teacher_id, day)] -= minutes
+
+
+def _place_meetings(course: CourseData, teacher: TeacherData, rooms: List[RoomData],
+                    blocks: Dict[int, List[int]], occupancy: _Occupancy, per_day: int) -> Optional[List[Assignment]]:
+    """Place every meeting of a course with one teacher, or nothing at all"""
+    starts = []
+    meetings_per_day = {}
+    for _ in range(course.sessions):
+        # Emptiest day first, earliest start within a day
+        order = sorted(blocks, key=lambda start_id: meetings_per_day.get(occupancy.day_of[start_id], 0))
+        placed = None
+        for start_id in order:
+            day = occupancy.day_of[start_id]
+            if meetings_per_day.get(day, 0) >= per_day:
+                break
+            covered = blocks[start_id]
+            if not occupancy.teacher_fits(teacher, covered):
+                continue
+            room = next((room for room in rooms if occupancy.room_free(room.id, covered)), None)
+            if room is not None:
+                placed = (teacher.id, room.id, start_id)
+                break
+        if placed is None:
+            for teacher_id, room_id, start_id in starts:
+                occupancy.release(teacher_id, room_id, blocks[start_id])
+            return None
+        occupancy.take(teacher.id, placed[1], blocks[placed[2]])
+        meetings_per_day[occupancy.day_of[placed[2]]] = meetings_per_day.get(occupancy.day_of[placed[2]], 0) + 1
+        starts.append(placed)
+    return starts
+
+
+def greedy_assignment(snapshot: SchedulingSnapshot, rules: SchedulingRules) -> Dict[int, List[Assignment]]:
+    """Place courses largest first, each meeting in the smallest suitable free room.
+
+    A course is placed as a whole with its least loaded teacher that can
+    take every meeting, or left out. Meetings are (teacher, room, starting
+    timeslot) blocks, as in the solver.
+    """
+    occupancy = _Occupancy(snapshot, rules)
+    teachers_by_department = snapshot.teachers_by_department()
+    rooms = sorted(snapshot.rooms, key=lambda room: (room.capacity, room.id))
+    blocks_by_length = {length: snapshot.blocks(length)
+                        for length in {course.block_length for course in snapshot.courses}}
+    day_count = max(1, snapshot.day_count())
+
+    assignment = {}
+    courses = sorted(snapshot.courses, key=lambda c: (-c.student_count, -c.sessions * c.block_length, c.id))
+    for course in courses:
+        suitable_rooms = [room for room in rooms if room_suits_course(course, room)]
+        teachers = sorted(teachers_by_department.get(course.department_id, []),
+                          key=lambda teacher: (occupancy.load(teacher.id), teacher.id))
+        for teacher in teachers:
+            starts = _place_meetings(course, teacher, suitable_rooms, blocks_by_length[course.block_length],
+                                     occupancy, math.ceil(course.sessions / day_count))
+            if starts:
+                assignment[course.id] = starts
+                break
+    return assignment
+
+
+class LnsScheduler(TimetableScheduler):
+    """Greedy construction improved by large neighbourhood search.
+
+    Meant for institutions too large to solve as one model in time. A greedy
+    pass places the largest courses first in the smallest suitable room.
+    Each step then frees the courses of one day, one department or one
+    building, keeps every other course fixed and re-solves the freed part
+    with CP-SAT under a short time limit, keeping the result when it is no
+    worse. Courses the greedy pass could not place are freed in every step
+    and cost a large penalty until they are placed. Incremental runs use the
+    regular neighbourhood re-solve.
+    """
+
+    def __init__(self, institution_id: int, settings: SolverSettings = None, on_progress=None):
+        super().__init__(institution_id, settings, on_progress)
+        # A failing step only means the neighbourhood was too small
+        self.explain_failures = False
+        self._history = []
+
+    def _on_solution(self, record: Dict[str, Any], history: List[Dict[str, Any]]):
+        """Solutions of one step are not progress of the run, only honour stop requests"""
+        if self.stop_requested:
+            self.recorder.StopSearch()
+
+    def _prefer_assignments(self, preferred: Dict[int, List[Assignment]], weight: int):
+        """Steps only hint the current assignment, moving classes is free"""
+        super()._prefer_assignments(preferred, 0)
+
+    def _report(self, objective: Optional[int], assignment: Dict[int, List[Assignment]], started: float):
+        record = {
+            'solution': len(self._history) + 1,
+            'objective': objective,
+            'best_bound': None,
+            'wall_time': round(time.perf_counter() - started, 3),
+            'timestamp': time.time(),
+            'placed': sum(len(starts) for starts in assignment.values())
+        }
+        self._history.append(record)
+        if self.on_progress:
+            self.on_progress(record, self._history)
+
+    def _generate(self, snapshot: SchedulingSnapshot) -> Dict[str, Any]:
+        started = time.perf_counter()
+        budget = self.settings
+        with self._timed('greedy'):
+            assignment = greedy_assignment(snapshot, SchedulingRules.from_rules(snapshot.rules))
+        self._report(None, assignment, started)
+
+        unplaced = {course.id for course in snapshot.courses if course.id not in assignment}
+        weights = ObjectiveWeights.from_rules(snapshot.rules)
+        soft = any((weights.wasted_capacity, weights.idle_gaps, weights.building_changes, weights.late_slots))
+        lns = {'greedy_placed': len(assignment), 'greedy_unplaced': len(unplaced),
+               'steps': 0, 'improvements': 0, 'neighbourhoods': {}}
+        self.stats['lns'] = lns
+        # Steps overwrite these with the size of their own model
+        self.stats['variable_count'] = 0
+        self.stats['constraint_count'] = 0
+        self.stats['session_count'] = sum(course.sessions for course in snapshot.courses)
+
+        rng = random.Random(budget.random_seed or 0)
+        candidates = self._neighbourhood_candidates(snapshot)
+        best_total = None
+        best_objective = None
+        stale = 0
+        with self._timed('lns'):
+            while (unplaced or soft) and candidates and stale < PATIENCE and not self.stop_requested:
+                remaining = STEP_SECONDS
+                if budget.max_time_seconds > 0:
+                    remaining = budget.max_time_seconds - (time.perf_counter() - started)
+                    if remaining <= 0:
+                        break
+
+                kind, key = self._pick_neighbourhood(rng, candidates, snapshot, unplaced)
+                free = self._free_courses(snapshot, assignment, kind, key, rng) | unplaced
+                lns['steps'] += 1
+                lns['neighbourhoods'][kind] = lns['neighbourhoods'].get(kind, 0) + 1
+
+                step = self._solve_step(snapshot, assignment, free, unplaced,
+                                        replace(budget, max_time_seconds=min(STEP_SECONDS, remaining)))
+                if step is None:
+                    stale += 1
+                    continue
+                solved, total = step
+                improved = best_total is None or total < best_total
+                if improved or total == best_total:
+                    assignment = solved
+                    unplaced = {course.id for course in snapshot.courses if course.id not in assignment}
+                    best_total = total
+                    best_objective = self.stats.get('objective') if self.objective_terms else None
+                if improved:
+                    lns['improvements'] += 1
+                    self._report(total, assignment, started)
+                stale = 0 if improved else stale + 1
+                if total == 0:
+                    break
+        self.settings = budget
+
+        lns['final_objective'] = best_total
+        if best_objective:
+            self.stats['objective'] = best_objective
+        missing = [course for course in snapshot.courses if course.id not in assignment]
+        if missing:
+            self.conflicts = [f"Course {course.name} could not be placed" for course in missing]
+            return {
+                'success': False,
+                'message': f'Could not place {len(missing)} courses within the search budget.',
+                'conflicts': self.conflicts + self._detect_conflicts(snapshot),
+                'stats': self.stats
+            }
+
+        timetable_entries = self._build_entries(snapshot, (
+            (course_id, teacher_id, room_id, start_id)
+            for course_id, starts in assignment.items()
+            for teacher_id, room_id, start_id in starts
+        ))
+        return {
+            'success': True,
+            'message': (f"Timetable generated successfully with {len(timetable_entries)} classes scheduled "
+                        f"after {lns['steps']} search steps."),
+            'conflicts': [],
+            'entries_count': len(timetable_entries),
+            'entries': timetable_entries,
+            'stats': self.stats
+        }
+
+    def _solve_step(self, snapshot: SchedulingSnapshot, assignment: Dict[int, List[Assignment]],
+                    free: Set[int], unplaced: Set[int], settings: SolverSettings) -> Optional[Tuple[Dict[int, List[Assignment]], int]]:
+        """Re-solve the free courses around the fixed rest, returning the new assignment and its objective"""
+        self._reset_model()
+        self.settings = settings
+        self.optional_courses = set(unplaced)
+        fixed = {course_id: starts for course_id, starts in assignment.items() if course_id not in free}
+        preferred = {course_id: starts for course_id, starts in assignment.items() if course_id in free}
+        result = self._solve(snapshot, fixed, preferred)
+        if not result['success']:
+            return None
+
+        solved = {}
+        for course_id, teacher_id, room_id, start_id in self.variables.selected(self.solver):
+            solved.setdefault(course_id, []).append((teacher_id, room_id, start_id))
+        # Optional courses only count once every meeting is placed
+        sessions = {course.id: course.sessions for course in snapshot.courses}
+        solved = {course_id: starts for course_id, starts in solved.items() if len(starts) == sessions[course_id]}
+        return solved, self.stats['objective']['total'] if self.objective_terms else 0
+
+    def _neighbourhood_candidates(self, snapshot: SchedulingSnapshot) -> List[Tuple[str, Any]]:
+        candidates = [('day', day) for day in sorted({ts.day_of_week for ts in snapshot.timeslots})]
+        candidates.extend(('department', department_id) for department_id in sorted(snapshot.department_ids()))
+        buildings = {room.building for room in snapshot.rooms}
+        if len(buildings) > 1:
+            candidates.extend(('building', building) for building in sorted(buildings, key=str))
+        return candidates
+
+    def _pick_neighbourhood(self, rng: random.Random, candidates: List[Tuple[str, Any]],
+                            snapshot: SchedulingSnapshot, unplaced: Set[int]) -> Tuple[str, Any]:
+        """A random neighbourhood, half the time the department of an unplaced course while there are any"""
+        if unplaced and rng.random() < 0.5:
+            course_id = rng.choice(sorted(unplaced))
+            department_id = next(course.department_id for course in snapshot.courses if course.id == course_id)
+            return 'department', department_id
+        return rng.choice(candidates)
+
+    def _free_courses(self, snapshot: SchedulingSnapshot, assignment: Dict[int, List[Assignment]],
+                      kind: str, key: Any, rng: random.Random) -> Set[int]:
+        """Courses of a neighbourhood, sampled down to MAX_FREE_COURSES"""
+        if kind == 'department':
+            free = {course.id for course in snapshot.courses if course.department_id == key}
+        elif kind == 'day':
+            days = {ts.id: ts.day_of_week for ts in snapshot.timeslots}
+            free = {course_id for course_id, starts in assignment.items()
+                    if any(days[start_id] == key for _, _, start_id in starts)}
+        else:
+            rooms = {room.id for room in snapshot.rooms if room.building == key}
+            free = {course_id for course_id, starts in assignment.items()
+                    if any(room_id in rooms for _, room_id, _ in starts)}
+        if len(free) > MAX_FREE_COURSES:
+            free = set(rng.sample(sorted(free), MAX_FREE_COURSES))
+        return free
@@ -0,0 +1,45 @@
+from dataclasses import dataclass, asdict
+from datetime import time
+from typing import Any, Dict
+from .rule_parsing import RuleSpec, parse_rules, parse_time
+
+# InstitutionRule names holding the soft-constraint weights
+WEIGHT_RULES: RuleSpec = {
+    'weight_wasted_capacity': ('wasted_capacity', int),
+    'weight_idle_gaps': ('idle_gaps', int),
+    'weight_building_changes': ('building_changes', int),
+    'weight_late_slots': ('late_slots', int),
+    'weight_moved': ('moved', int),
+    'late_slot_start': ('late_slot_start', parse_time),
+}
+
+# Periods starting at or after this time count as late, unless overridden by
+# the late_slot_start rule
+DEFAULT_LATE_SLOT_START = time(16, 0)
+
+
+@dataclass
+class ObjectiveWeights:
+    """Integer weights of the soft constraints. All zero means pure feasibility.
+
+    wasted_capacity is per empty seat and period, idle_gaps per free period
+    between a teacher's first and last class of a day, building_changes per
+    back-to-back pair of classes in different buildings, late_slots per
+    period starting after late_slot_start and moved per meeting an
+    incremental run moves away from its stored place.
+    """
+    wasted_capacity: int = 0
+    idle_gaps: int = 0
+    building_changes: int = 0
+    late_slots: int = 0
+    moved: int = 1000
+    late_slot_start: time = DEFAULT_LATE_SLOT_START
+
+    @classmethod
+    def from_rules(cls, rules: Dict[str, str]) -> 'ObjectiveWeights':
+        return cls(**parse_rules(rules, WEIGHT_RULES))
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = asdict(self)
+        values['late_slot_start'] = self.late_slot_start.strftime('%H:%M')
+        return values
@@ -0,0 +1,153 @@
+from datetime import datetime
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+from models import Course, Department, Room, Teacher, TimeSlot, TimetableEntry, TimetableVersion
+from app import db
+import csv
+import io
+import os
+
+# Rows per executemany batch when inserting generated entries
+INSERT_BATCH_SIZE = int(os.environ.get('TIMETABLE_INSERT_BATCH_SIZE', '1000'))
+
+# Use COPY FROM STDIN on PostgreSQL (psycopg2) instead of INSERT batches
+USE_COPY = os.environ.get('TIMETABLE_USE_COPY', '1') == '1'
+
+# Rows shown in timetable views; changing one changes the institution's
+# timetable version
+VERSIONED_MODELS = (TimetableEntry, Course, Department, Teacher, Room, TimeSlot)
+
+ENTRY_COLUMNS = ('course_id', 'teacher_id', 'room_id', 'timeslot_id', 'institution_id',
+                 'section', 'is_manual', 'created_at')
+
+
+def scoped_entries_query(institution_id: int, department_id: int = None, include_manual: bool = True):
+    """Timetable entries of an institution, optionally limited to one department.
+
+    Department scoping uses a subquery rather than a join so the query can be
+    used for bulk deletes.
+    """
+    query = TimetableEntry.query.filter(TimetableEntry.institution_id == institution_id)
+    if not include_manual:
+        query = query.filter(TimetableEntry.is_manual == False)  # noqa: E712
+    if department_id:
+        query = query.filter(TimetableEntry.course_id.in_(
+            select(Course.id).where(Course.department_id == department_id)
+        ))
+    return query
+
+
+def _copy_entries(rows: List[Dict]) -> bool:
+    """Stream rows into timetable_entries with COPY; False if the driver can't"""
+    cursor = db.session.connection().connection.cursor()
+    if not hasattr(cursor, 'copy_expert'):
+        cursor.close()
+        return False
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in ENTRY_COLUMNS])
+    buffer.seek(0)
+    try:
+        cursor.copy_expert(
+            f"COPY {TimetableEntry.__tablename__} ({', '.join(ENTRY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+    return True
+
+
+def bulk_insert_entries(entries: List[Dict], batch_size: int = None) -> Dict[str, Any]:
+    """Insert entry dicts without ORM unit-of-work bookkeeping.
+
+    Runs inside the caller's transaction and does not commit.
+    """
+    batch_size = batch_size or INSERT_BATCH_SIZE
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            'course_id': entry['course_id'],
+            'teacher_id': entry['teacher_id'],
+            'room_id': entry['room_id'],
+            'timeslot_id': entry['timeslot_id'],
+            'institution_id': entry['institution_id'],
+            'section': entry.get('section', 'A'),
+            'is_manual': entry.get('is_manual', False),
+            'created_at': created_at
+        }
+        for entry in entries
+    ]
+    if not rows:
+        return {'method': 'none', 'rows': 0, 'batches': 0}
+
+    if USE_COPY and db.session.get_bind().dialect.name == 'postgresql' and _copy_entries(rows):
+        return {'method': 'copy', 'rows': len(rows), 'batches': 1}
+
+    batches = 0
+    statement = insert(TimetableEntry.__table__)
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(statement, rows[start:start + batch_size])
+        batches += 1
+    return {'method': 'executemany', 'rows': len(rows), 'batches': batches}
+
+
+def replace_timetable(institution_id: int, department_id: int, entries: List[Dict],
+                      batch_size: int = None) -> Dict[str, Any]:
+    """Swap the stored timetable for newly generated entries in one transaction.
+
+    The old entries stay visible to readers until the commit, and a failure
+    rolls back to them untouched. Manually placed entries are never replaced.
+    """
+    try:
+        deleted = scoped_entries_query(institution_id, department_id, include_manual=False).delete(
+            synchronize_session=False
+        )
+        summary = bulk_insert_entries(entries, batch_size)
+        bump_timetable_version(institution_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    summary['deleted'] = deleted
+    return summary
+
+
+def bump_timetable_version(institution_id: int, connection=None):
+    """Mark an institution's timetable as changed, inside the caller's transaction.
+
+    Bulk statements bypass the ORM, so code deleting or inserting entries in
+    bulk has to call this itself. ORM changes are picked up on flush.
+    """
+    connection = connection or db.session.connection()
+    table = TimetableVersion.__table__
+    now = datetime.utcnow()
+    updated = connection.execute(
+        table.update().where(table.c.institution_id == institution_id)
+        .values(version=table.c.version + 1, updated_at=now)
+    )
+    if updated.rowcount == 0:
+        connection.execute(table.insert().values(institution_id=institution_id, version=1, updated_at=now))
+
+
+def timetable_version(institution_id: int) -> Tuple[int, Optional[datetime]]:
+    """Current version of an institution's timetable and when it last changed"""
+    row = db.session.query(TimetableVersion.version, TimetableVersion.updated_at).filter(
+        TimetableVersion.institution_id == institution_id
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_versions(session: Session, flush_context):
+    """Bump the version of every institution whose timetable rows were flushed"""
+    institution_ids = {
+        instance.institution_id
+        for instance in chain(session.new, session.dirty, session.deleted)
+        if isinstance(instance, VERSIONED_MODELS) and instance.institution_id
+    }
+    for institution_id in sorted(institution_ids):
+        bump_timetable_version(institution_id, session.connection())
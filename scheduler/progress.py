@@ -0,0 +1,36 @@
+from typing import Any, Callable, Dict, List, Optional
+from ortools.sat.python import cp_model
+import time
+
+ProgressHandler = Callable[[Dict[str, Any], List[Dict[str, Any]]], None]
+
+
+class SolutionRecorder(cp_model.CpSolverSolutionCallback):
+    """Record every improving solution CP-SAT reports during a solve.
+
+    Each record holds the objective (None for pure feasibility models), the
+    solver wall time and how many classes the solution places. The optional
+    handler is called with the new record and the full history, which lets
+    job runners publish live progress.
+    """
+
+    def __init__(self, literals: List[cp_model.IntVar], has_objective: bool,
+                 on_solution: Optional[ProgressHandler] = None):
+        super().__init__()
+        self._placed = cp_model.LinearExpr.Sum(literals)
+        self._has_objective = has_objective
+        self._on_solution = on_solution
+        self.solutions = []
+
+    def on_solution_callback(self):
+        record = {
+            'solution': len(self.solutions) + 1,
+            'objective': self.ObjectiveValue() if self._has_objective else None,
+            'best_bound': self.BestObjectiveBound() if self._has_objective else None,
+            'wall_time': round(self.WallTime(), 3),
+            'timestamp': time.time(),
+            'placed': int(self.Value(self._placed))
+        }
+        self.solutions.append(record)
+        if self._on_solution:
+            self._on_solution(record, self.solutions)
@@ -0,0 +1,33 @@
+from datetime import datetime, time
+from typing import Any, Callable, Dict, Tuple
+import logging
+
+# InstitutionRule name -> (attribute, function casting the stored string)
+RuleSpec = Dict[str, Tuple[str, Callable[[str], Any]]]
+
+
+def parse_time(raw_value: str) -> time:
+    return datetime.strptime(raw_value, '%H:%M').time()
+
+
+def parse_flag(raw_value: str) -> bool:
+    return raw_value not in ('0', 'false', 'False')
+
+
+def parse_rules(rules: Dict[str, str], spec: RuleSpec) -> Dict[str, Any]:
+    """Typed values of the rules in spec by attribute, skipping unset, malformed and negative ones"""
+    values = {}
+    for rule_name, (attribute, cast) in spec.items():
+        raw_value = rules.get(rule_name)
+        if raw_value in (None, ''):
+            continue
+        try:
+            value = cast(raw_value)
+        except ValueError:
+            logging.warning(f"Ignoring invalid rule {rule_name}={raw_value!r}")
+            continue
+        if isinstance(value, (int, float)) and value < 0:
+            logging.warning(f"Ignoring negative rule {rule_name}={raw_value!r}")
+            continue
+        values[attribute] = value
+    return values
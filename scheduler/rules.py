@@ -0,0 +1,111 @@
+from dataclasses import dataclass, asdict
+from datetime import time
+from typing import Any, Dict, List, Optional, Tuple
+from .rule_parsing import RuleSpec, parse_flag, parse_rules, parse_time
+from .snapshot import SchedulingSnapshot, TimeSlotData
+
+# Part of the day in which the lunch break has to fall, unless overridden by
+# the lunch_window_start / lunch_window_end rules
+DEFAULT_LUNCH_WINDOW = (time(11, 0), time(14, 0))
+
+# InstitutionRule names read by the constraint builder
+CONSTRAINT_RULES: RuleSpec = {
+    'max_hours_per_day': ('max_hours_per_day', float),
+    'max_hours_per_week': ('max_hours_per_week', float),
+    'max_consecutive': ('max_consecutive', int),
+    'min_gap': ('min_gap_minutes', int),
+    'lunch_break': ('lunch_break_minutes', int),
+    'allow_back_to_back': ('allow_back_to_back', parse_flag),
+}
+LUNCH_WINDOW_RULES: RuleSpec = {
+    'lunch_window_start': ('start', parse_time),
+    'lunch_window_end': ('end', parse_time),
+}
+
+
+def _minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+
+@dataclass
+class SchedulingRules:
+    """Teaching-load rules from the setup wizard. Zero or None disables a rule."""
+    max_hours_per_day: float = 0.0
+    max_hours_per_week: float = 0.0
+    max_consecutive: int = 0
+    min_gap_minutes: int = 0
+    lunch_break_minutes: int = 0
+    allow_back_to_back: bool = True
+    lunch_window: Tuple[time, time] = DEFAULT_LUNCH_WINDOW
+
+    @classmethod
+    def from_rules(cls, rules: Dict[str, str]) -> 'SchedulingRules':
+        window = parse_rules(rules, LUNCH_WINDOW_RULES)
+        return cls(
+            **parse_rules(rules, CONSTRAINT_RULES),
+            lunch_window=(window.get('start', DEFAULT_LUNCH_WINDOW[0]), window.get('end', DEFAULT_LUNCH_WINDOW[1]))
+        )
+
+    def weekly_minutes(self, teacher_max_hours: Optional[int]) -> int:
+        """A teacher's weekly teaching cap in minutes, 0 for no cap"""
+        caps = [hours for hours in (teacher_max_hours, self.max_hours_per_week) if hours]
+        return int(min(caps) * 60) if caps else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = asdict(self)
+        values['lunch_window'] = [value.strftime('%H:%M') for value in self.lunch_window]
+        return values
+
+
+def timeslots_by_day(snapshot: SchedulingSnapshot) -> Dict[int, List[TimeSlotData]]:
+    grouped = {}
+    for timeslot in snapshot.timeslots:
+        grouped.setdefault(timeslot.day_of_week, []).append(timeslot)
+    return grouped
+
+
+def break_pairs(snapshot: SchedulingSnapshot, rules: SchedulingRules) -> List[Tuple[int, int]]:
+    """Adjacent timeslot pairs a teacher may not teach separate classes in.
+
+    That is every adjacent pair when back-to-back classes are not allowed,
+    and otherwise the pairs whose break is shorter than the minimum gap.
+    """
+    pairs = []
+    for day_slots in timeslots_by_day(snapshot).values():
+        for previous, following in zip(day_slots, day_slots[1:]):
+            gap = _minutes(following.start_time) - _minutes(previous.end_time)
+            if not rules.allow_back_to_back or gap < rules.min_gap_minutes:
+                pairs.append((previous.id, following.id))
+    return pairs
+
+
+def lunch_windows(day_slots: List[TimeSlotData], rules: SchedulingRules) -> Optional[List[List[int]]]:
+    """Runs of timeslots on one day whose freeing gives a long enough lunch break.
+
+    Returns None when the day already has a long enough break inside the
+    lunch window, and only the shortest run from each starting timeslot
+    otherwise.
+    """
+    window_start, window_end = (_minutes(value) for value in rules.lunch_window)
+    needed = rules.lunch_break_minutes
+    starts = [_minutes(timeslot.start_time) for timeslot in day_slots]
+    ends = [_minutes(timeslot.end_time) for timeslot in day_slots]
+
+    def free_minutes(after: int, before: int) -> int:
+        """Free time between the end of slot `after` and the start of slot `before`"""
+        free_from = max(ends[after] if after >= 0 else window_start, window_start)
+        free_until = min(starts[before] if before < len(day_slots) else window_end, window_end)
+        return free_until - free_from
+
+    if any(free_minutes(position - 1, position) >= needed for position in range(len(day_slots) + 1)):
+        return None
+
+    windows = []
+    for first in range(len(day_slots)):
+        if ends[first] <= window_start or starts[first] >= window_end:
+            continue
+        for last in range(first, len(day_slots)):
+            if free_minutes(first - 1, last + 1) >= needed:
+                windows.append([timeslot.id for timeslot in day_slots[first:last + 1]])
+                break
+    return windows
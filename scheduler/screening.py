@@ -0,0 +1,200 @@
+from collections import deque
+from typing import Dict, Hashable, List, Set, Tuple
+from .rules import SchedulingRules, timeslots_by_day
+from .snapshot import CourseData, SchedulingSnapshot, TeacherData, room_suits_course
+
+# Courses named in one screening message before the rest are summarised
+MAX_NAMED_COURSES = 5
+
+
+def _course_names(courses: List[CourseData]) -> str:
+    names = ', '.join(course.name for course in courses[:MAX_NAMED_COURSES])
+    if len(courses) > MAX_NAMED_COURSES:
+        names += f" and {len(courses) - MAX_NAMED_COURSES} more"
+    return names
+
+
+def _periods(course: CourseData) -> int:
+    return course.sessions * course.block_length
+
+
+def _max_flow(capacities: Dict[Hashable, Dict[Hashable, int]], source: Hashable, sink: Hashable) -> Tuple[int, Set[Hashable]]:
+    """Edmonds-Karp maximum flow on a small graph.
+
+    Returns the flow value and the nodes still reachable from the source in
+    the residual graph, which form a minimum cut.
+    """
+    residual = {node: dict(edges) for node, edges in capacities.items()}
+    for node, edges in capacities.items():
+        for target in edges:
+            residual.setdefault(target, {}).setdefault(node, 0)
+
+    def reachable() -> Dict[Hashable, Hashable]:
+        parents = {source: None}
+        queue = deque([source])
+        while queue and sink not in parents:
+            node = queue.popleft()
+            for target, capacity in residual[node].items():
+                if capacity > 0 and target not in parents:
+                    parents[target] = node
+                    queue.append(target)
+        return parents
+
+    flow = 0
+    while True:
+        parents = reachable()
+        if sink not in parents:
+            return flow, set(parents)
+        path = []
+        node = sink
+        while parents[node] is not None:
+            path.append((parents[node], node))
+            node = parents[node]
+        pushed = min(residual[u][v] for u, v in path)
+        for u, v in path:
+            residual[u][v] -= pushed
+            residual[v][u] += pushed
+        flow += pushed
+
+
+def _room_reasons(snapshot: SchedulingSnapshot) -> List[str]:
+    """Match the periods courses need to free room periods of suitable rooms.
+
+    Timeslots are interchangeable for this check, so courses are grouped by
+    size and room type and rooms by capacity and type, and a maximum flow
+    between the groups stands in for the matching of course periods to
+    (room, timeslot) pairs. When not every period can be matched, the
+    minimum cut names a set of courses needing more periods than the rooms
+    they fit in have free.
+    """
+    reasons = []
+    free_periods = {
+        room.id: sum(1 for ts in snapshot.timeslots if (room.id, ts.id) not in snapshot.blocked)
+        for room in snapshot.rooms
+    }
+
+    # Room type supply against the demand of courses that need that type
+    for room_type in sorted({course.room_type for course in snapshot.courses if course.room_type}):
+        typed = [course for course in snapshot.courses if course.room_type == room_type]
+        demand = sum(_periods(course) for course in typed)
+        supply = sum(free_periods[room.id] for room in snapshot.rooms if room.room_type == room_type)
+        if demand > supply:
+            reasons.append(f"Courses needing a {room_type} room ({_course_names(typed)}) need {demand} "
+                           f"periods but {room_type} rooms only have {supply} free periods")
+    if reasons:
+        return reasons
+
+    course_groups = {}
+    for course in snapshot.courses:
+        course_groups.setdefault(('courses', course.student_count, course.room_type), []).append(course)
+    room_groups = {}
+    for room in snapshot.rooms:
+        room_groups.setdefault(('rooms', room.capacity, room.room_type), []).append(room)
+
+    # Course to room edges are unbounded, so the minimum cut only cuts
+    # course demand and room supply
+    demand = sum(_periods(course) for course in snapshot.courses)
+    capacities = {'source': {}}
+    for course_group, courses in course_groups.items():
+        capacities['source'][course_group] = sum(_periods(course) for course in courses)
+        capacities[course_group] = {
+            room_group: demand
+            for room_group, rooms in room_groups.items()
+            if room_suits_course(courses[0], rooms[0])
+        }
+    for room_group, rooms in room_groups.items():
+        capacities[room_group] = {'sink': sum(free_periods[room.id] for room in rooms)}
+
+    flow, cut = _max_flow(capacities, 'source', 'sink')
+    if flow < demand:
+        short = sorted((course for group in course_groups if group in cut for course in course_groups[group]),
+                       key=lambda course: (-course.student_count, course.name))
+        rooms = {room_group for group in course_groups if group in cut for room_group in capacities[group]}
+        needed = sum(_periods(course) for course in short)
+        offered = sum(free_periods[room.id] for group in rooms for room in room_groups[group])
+        reasons.append(f"Courses {_course_names(short)} need {needed} periods in rooms that suit them "
+                       f"but those rooms only have {offered} free periods")
+    return reasons
+
+
+def _teacher_capacity(teacher: TeacherData, snapshot: SchedulingSnapshot, rules: SchedulingRules,
+                      pinned_minutes: Dict[Tuple[int, int], int], shortest: int) -> int:
+    """Upper bound on the periods a teacher can teach in a week, besides manually placed classes"""
+    unavailable = snapshot.unavailable.get(teacher.id, ())
+    periods = 0
+    for day, day_slots in timeslots_by_day(snapshot).items():
+        available = sum(1 for ts in day_slots if ts.id not in unavailable)
+        if rules.max_hours_per_day:
+            daily_cap = int(rules.max_hours_per_day * 60) - pinned_minutes.get((teacher.id, day), 0)
+            available = min(available, max(0, daily_cap) // shortest)
+        periods += available
+    weekly_cap = rules.weekly_minutes(teacher.max_hours_per_week)
+    if weekly_cap:
+        pinned = sum(minutes for (teacher_id, _), minutes in pinned_minutes.items() if teacher_id == teacher.id)
+        periods = min(periods, max(0, weekly_cap - pinned) // shortest)
+    return periods
+
+
+def _teacher_reasons(snapshot: SchedulingSnapshot) -> List[str]:
+    """Compare each department's teaching demand with what its teachers can take.
+
+    Every course is taught by one teacher of its department, so each course
+    has to fit the capacity of some teacher and all courses of a department
+    the combined capacity of its teachers. Capacities count available
+    timeslots capped by the daily and weekly hour limits, measured in the
+    shortest period so they never understate what a teacher can teach.
+    """
+    if not snapshot.timeslots:
+        return []
+    rules = SchedulingRules.from_rules(snapshot.rules)
+    shortest = max(1, min(ts.minutes for ts in snapshot.timeslots))
+    timeslots = {ts.id: ts for ts in snapshot.timeslots}
+    pinned_minutes = {}
+    for assignments in snapshot.pinned.values():
+        for teacher_id, _, timeslot_id in assignments:
+            timeslot = timeslots.get(timeslot_id)
+            if timeslot:
+                key = (teacher_id, timeslot.day_of_week)
+                pinned_minutes[key] = pinned_minutes.get(key, 0) + timeslot.minutes
+    teachers_by_department = snapshot.teachers_by_department()
+    reasons = []
+    for department_id in sorted(snapshot.department_ids()):
+        courses = [course for course in snapshot.courses if course.department_id == department_id]
+        teachers = teachers_by_department.get(department_id, [])
+        if not teachers:
+            reasons.append(f"Courses {_course_names(courses)} belong to department {department_id}, "
+                           f"which has no teachers")
+            continue
+        capacities = {teacher.id: _teacher_capacity(teacher, snapshot, rules, pinned_minutes, shortest)
+                      for teacher in teachers}
+        most = max(capacities.values())
+        too_long = [course for course in courses if _periods(course) > most]
+        for course in too_long:
+            reasons.append(f"Course {course.name} needs {_periods(course)} periods with one teacher but no "
+                           f"teacher of department {department_id} can teach more than {most}")
+        demand = sum(_periods(course) for course in courses)
+        if demand > sum(capacities.values()):
+            reasons.append(f"Department {department_id} needs {demand} teaching periods but its "
+                           f"{len(teachers)} teachers can teach at most {sum(capacities.values())}")
+    return reasons
+
+
+def screen_snapshot(snapshot: SchedulingSnapshot) -> List[str]:
+    """Reasons the snapshot is certainly infeasible, found without building a model.
+
+    Every check is a necessary condition only, so an empty list does not
+    promise a timetable exists.
+    """
+    reasons = list(snapshot.pin_conflicts)
+    for course in snapshot.courses:
+        if not any(room_suits_course(course, room) for room in snapshot.rooms):
+            if course.room_type:
+                reasons.append(f"Course {course.name} needs a {course.room_type} room for {course.student_count} students but none is available")
+            else:
+                reasons.append(f"Course {course.name} has {course.student_count} students but no room has sufficient capacity")
+        if course.block_length > 1 and not snapshot.blocks(course.block_length):
+            reasons.append(f"Course {course.name} needs {course.block_length} consecutive periods but no day has that many")
+    if not reasons:
+        reasons.extend(_room_reasons(snapshot))
+    reasons.extend(_teacher_reasons(snapshot))
+    return reasons
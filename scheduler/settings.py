@@ -0,0 +1,68 @@
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional
+from ortools.sat.python import cp_model
+from .rule_parsing import RuleSpec, parse_rules
+
+# InstitutionRule names read by the solver
+SOLVER_RULES: RuleSpec = {
+    'solver_max_time_seconds': ('max_time_seconds', float),
+    'solver_num_workers': ('num_workers', int),
+    'solver_relative_gap': ('relative_gap', float),
+    'solver_random_seed': ('random_seed', int),
+}
+
+
+@dataclass
+class SolverSettings:
+    """CP-SAT search budget for one generation run"""
+    max_time_seconds: float = 60.0
+    num_workers: int = 0  # 0 lets CP-SAT use every available core
+    relative_gap: float = 0.0
+    random_seed: Optional[int] = None
+
+    @classmethod
+    def from_rules(cls, rules: Dict[str, str]) -> 'SolverSettings':
+        return cls(**parse_rules(rules, SOLVER_RULES))
+
+    def apply(self, solver: cp_model.CpSolver):
+        """Copy the settings onto a solver's parameters"""
+        if self.max_time_seconds > 0:
+            solver.parameters.max_time_in_seconds = self.max_time_seconds
+        if self.num_workers > 0:
+            solver.parameters.num_search_workers = self.num_workers
+        if self.relative_gap > 0:
+            solver.parameters.relative_gap_limit = self.relative_gap
+        if self.random_seed is not None:
+            solver.parameters.random_seed = self.random_seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def describe_solve(solver: cp_model.CpSolver, status: int, settings: SolverSettings,
+                   stopped: bool = False) -> Dict[str, Any]:
+    """Summarise a finished solve, including which search limits stopped it.
+
+    UNKNOWN means the budget ran out before any solution was found. FEASIBLE
+    means a solution exists but optimality was not proven, either because the
+    relative gap target was met, because time ran out or because the user
+    accepted the best solution early.
+    """
+    limits_hit = []
+    if stopped and status in (cp_model.FEASIBLE, cp_model.UNKNOWN):
+        limits_hit.append('user_stop')
+    elif status == cp_model.UNKNOWN:
+        limits_hit.append('time_limit')
+    elif status == cp_model.FEASIBLE:
+        objective = solver.ObjectiveValue()
+        gap = abs(objective - solver.BestObjectiveBound()) / max(1.0, abs(objective))
+        if settings.relative_gap > 0 and gap <= settings.relative_gap:
+            limits_hit.append('relative_gap')
+        else:
+            limits_hit.append('time_limit')
+    return {
+        'status': solver.StatusName(status),
+        'wall_time': round(solver.WallTime(), 4),
+        'limits_hit': limits_hit,
+        'settings': settings.to_dict()
+    }
@@ -0,0 +1,373 @@
+from dataclasses import dataclass, field, replace
+from datetime import datetime, time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import math
+import statistics
+from sqlalchemy import select
+from models import Course, Teacher, Room, TimeSlot, FacultyAvailability, InstitutionRule, TimetableEntry
+from app import db
+from .persistence import scoped_entries_query
+
+# Longest break between two timeslots that a multi-period block may span
+BLOCK_MAX_BREAK_MINUTES = 10
+
+
+@dataclass(frozen=True)
+class CourseData:
+    id: int
+    name: str
+    code: str
+    department_id: int
+    student_count: int
+    credits: int
+    duration_minutes: int
+    room_type: Optional[str]
+    sessions: int = 1  # meetings per week
+    block_length: int = 1  # contiguous timeslots per meeting
+
+
+@dataclass(frozen=True)
+class TeacherData:
+    id: int
+    name: str
+    department_id: int
+    max_hours_per_week: int
+
+
+@dataclass(frozen=True)
+class RoomData:
+    id: int
+    name: str
+    capacity: int
+    room_type: str
+    building: Optional[str]
+
+
+@dataclass(frozen=True)
+class TimeSlotData:
+    id: int
+    day_of_week: int
+    start_time: time
+    end_time: time
+
+    @property
+    def minutes(self) -> int:
+        return _minutes_between(self.start_time, self.end_time)
+
+
+def _minutes_between(start: time, end: time) -> int:
+    today = datetime.min.date()
+    return int((datetime.combine(today, end) - datetime.combine(today, start)).total_seconds() // 60)
+
+
+def _blocks(timeslots: List[TimeSlotData], length: int) -> Dict[int, List[int]]:
+    blocks = {}
+    for position, timeslot in enumerate(timeslots):
+        covered = timeslots[position:position + length]
+        if len(covered) < length:
+            break
+        if all(
+            following.day_of_week == previous.day_of_week
+            and _minutes_between(previous.end_time, following.start_time) <= BLOCK_MAX_BREAK_MINUTES
+            for previous, following in zip(covered, covered[1:])
+        ):
+            blocks[timeslot.id] = [covered_slot.id for covered_slot in covered]
+    return blocks
+
+
+def session_plan(credits: int, duration_minutes: int, slot_minutes: int) -> Tuple[int, int]:
+    """Weekly (sessions, block length) for a course.
+
+    A course meets for one timeslot per credit each week. A meeting lasts
+    duration_minutes rounded to whole timeslots, so a 150 minute lab with
+    50 minute timeslots is one three-period block.
+    """
+    block_length = max(1, round(duration_minutes / slot_minutes)) if slot_minutes > 0 else 1
+    sessions = max(1, math.ceil((credits or 1) / block_length))
+    return sessions, block_length
+
+
+@dataclass
+class SchedulingSnapshot:
+    """In-memory copy of everything the scheduler reads from the database.
+
+    Constraint builders only look at this snapshot, so a generation run costs
+    a fixed number of queries however many courses and teachers there are.
+    The snapshot holds plain values and can be pickled.
+    """
+    institution_id: int
+    department_id: Optional[int]
+    courses: List[CourseData]
+    teachers: List[TeacherData]
+    rooms: List[RoomData]
+    timeslots: List[TimeSlotData]
+    unavailable: Dict[int, Set[int]] = field(default_factory=dict)
+    rules: Dict[str, str] = field(default_factory=dict)
+    # (room_id, timeslot_id) pairs this run must leave free
+    blocked: Set[Tuple[int, int]] = field(default_factory=set)
+    # Stored (teacher_id, room_id, timeslot_id) assignments per course, only
+    # loaded for incremental runs
+    current: Dict[int, List[Tuple[int, int, int]]] = field(default_factory=dict)
+    # Manually placed assignments per course, together with the completions
+    # below. Their meetings are left out of `courses` and the room and
+    # teacher time they use is closed
+    pinned: Dict[int, List[Tuple[int, int, int]]] = field(default_factory=dict)
+    # Generated periods completing meetings only partly placed by hand, per
+    # course. They are written back with the new timetable
+    completions: Dict[int, List[Tuple[int, int, int]]] = field(default_factory=dict)
+    # Partly manual meetings that cannot be completed
+    pin_conflicts: List[str] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not self.courses or not self.teachers or not self.rooms or not self.timeslots
+
+    def teachers_by_department(self) -> Dict[int, List[TeacherData]]:
+        grouped = {}
+        for teacher in self.teachers:
+            grouped.setdefault(teacher.department_id, []).append(teacher)
+        return grouped
+
+    def department_ids(self) -> List[int]:
+        return sorted({course.department_id for course in self.courses})
+
+    def pinned_count(self) -> int:
+        """Number of manually placed periods"""
+        return (sum(len(assignments) for assignments in self.pinned.values())
+                - sum(len(assignments) for assignments in self.completions.values()))
+
+    def day_count(self) -> int:
+        return len({timeslot.day_of_week for timeslot in self.timeslots})
+
+    def blocks(self, length: int) -> Dict[int, List[int]]:
+        """Timeslot ids covered by a block of `length` periods, by starting timeslot.
+
+        A block stays within one day and only spans short breaks.
+        """
+        return _blocks(self.timeslots, length)
+
+    def for_department(self, department_id: int,
+                       blocked: Iterable[Tuple[int, int]] = ()) -> 'SchedulingSnapshot':
+        """Sub-snapshot with one department's courses and teachers and shared rooms"""
+        teachers = [t for t in self.teachers if t.department_id == department_id]
+        courses = [c for c in self.courses if c.department_id == department_id]
+        return replace(
+            self,
+            department_id=department_id,
+            courses=courses,
+            teachers=teachers,
+            unavailable={t.id: self.unavailable.get(t.id, set()) for t in teachers},
+            blocked=self.blocked | set(blocked),
+            current={c.id: self.current[c.id] for c in courses if c.id in self.current}
+        )
+
+
+def _pinned_meetings(assignments: List[Tuple[int, int, int]], blocks: Dict[int, List[int]],
+                     positions: Dict[int, int]) -> List[List[Tuple[int, int, int]]]:
+    """Group a course's manual periods into meetings.
+
+    Periods with the same teacher and room that fit in one block of the
+    course belong to the same meeting.
+    """
+    meetings = []
+    for assignment in sorted(assignments, key=lambda a: positions.get(a[2], -1)):
+        meeting = meetings[-1] if meetings else None
+        if meeting and meeting[0][:2] == assignment[:2] and any(
+            assignment[2] in covered and all(timeslot_id in covered for _, _, timeslot_id in meeting)
+            for covered in blocks.values()
+        ):
+            meeting.append(assignment)
+        else:
+            meetings.append([assignment])
+    return meetings
+
+
+def _complete_meeting(meeting: List[Tuple[int, int, int]], blocks: Dict[int, List[int]],
+                      blocked: Set[Tuple[int, int]], unavailable: Set[int],
+                      stored: Set[Tuple[int, int, int]]) -> Optional[List[Tuple[int, int, int]]]:
+    """Periods completing a partly manual meeting to a whole block, None if none fits.
+
+    The rest of the block keeps the teacher and room of the manual periods.
+    Of the blocks that fit, the one keeping most stored periods wins.
+    """
+    teacher_id, room_id = meeting[0][:2]
+    manual = {timeslot_id for _, _, timeslot_id in meeting}
+    best = None
+    for covered in blocks.values():
+        if not manual.issubset(covered):
+            continue
+        rest = [timeslot_id for timeslot_id in covered if timeslot_id not in manual]
+        if any((room_id, timeslot_id) in blocked or timeslot_id in unavailable for timeslot_id in rest):
+            continue
+        kept = sum((teacher_id, room_id, timeslot_id) in stored for timeslot_id in rest)
+        if best is None or kept > best[0]:
+            best = (kept, rest)
+    if best is None:
+        return None
+    return [(teacher_id, room_id, timeslot_id) for timeslot_id in best[1]]
+
+
+def room_suits_course(course: CourseData, room: RoomData) -> bool:
+    """Check room capacity and room type against the course requirements"""
+    if room.capacity < course.student_count:
+        return False
+    if course.room_type and room.room_type != course.room_type:
+        return False
+    return True
+
+
+def load_snapshot(institution_id: int, department_id: int = None,
+                  with_current: bool = False) -> SchedulingSnapshot:
+    """Load courses, teachers, rooms, timeslots, availability and rules in bulk"""
+    course_query = db.session.query(
+        Course.id, Course.name, Course.code, Course.department_id, Course.student_count,
+        Course.credits, Course.duration_minutes, Course.room_type
+    ).filter(Course.institution_id == institution_id)
+    teacher_query = db.session.query(
+        Teacher.id, Teacher.name, Teacher.department_id, Teacher.max_hours_per_week
+    ).filter(Teacher.institution_id == institution_id)
+    if department_id:
+        course_query = course_query.filter(Course.department_id == department_id)
+        teacher_query = teacher_query.filter(Teacher.department_id == department_id)
+
+    teachers = [
+        TeacherData(row.id, row.name, row.department_id, row.max_hours_per_week or 40)
+        for row in teacher_query.order_by(Teacher.id)
+    ]
+    rooms = [
+        RoomData(row.id, row.name, row.capacity, row.room_type, row.building)
+        for row in db.session.query(
+            Room.id, Room.name, Room.capacity, Room.room_type, Room.building
+        ).filter(Room.institution_id == institution_id).order_by(Room.id)
+    ]
+    timeslots = [
+        TimeSlotData(row.id, row.day_of_week, row.start_time, row.end_time)
+        for row in db.session.query(
+            TimeSlot.id, TimeSlot.day_of_week, TimeSlot.start_time, TimeSlot.end_time
+        ).filter(TimeSlot.institution_id == institution_id).order_by(
+            TimeSlot.day_of_week, TimeSlot.start_time
+        )
+    ]
+
+    slot_minutes = int(statistics.median(ts.minutes for ts in timeslots)) if timeslots else 0
+    courses = []
+    for row in course_query.order_by(Course.id):
+        duration_minutes = row.duration_minutes or 60
+        sessions, block_length = session_plan(row.credits, duration_minutes, slot_minutes)
+        courses.append(CourseData(
+            row.id, row.name, row.code, row.department_id, row.student_count or 0,
+            row.credits, duration_minutes, row.room_type, sessions, block_length
+        ))
+
+    unavailable = {teacher.id: set() for teacher in teachers}
+    availability_rows = db.session.query(
+        FacultyAvailability.teacher_id, FacultyAvailability.timeslot_id
+    ).join(Teacher, Teacher.id == FacultyAvailability.teacher_id).filter(
+        Teacher.institution_id == institution_id,
+        FacultyAvailability.is_available == False  # noqa: E712
+    )
+    for teacher_id, timeslot_id in availability_rows:
+        if teacher_id in unavailable:
+            unavailable[teacher_id].add(timeslot_id)
+
+    # Rooms already used by other departments stay off limits for a
+    # department-scoped run
+    blocked = set()
+    if department_id:
+        blocked = set(db.session.query(TimetableEntry.room_id, TimetableEntry.timeslot_id).filter(
+            TimetableEntry.institution_id == institution_id,
+            TimetableEntry.course_id.notin_(select(Course.id).where(Course.department_id == department_id))
+        ))
+
+    # Manual entries are pinned: the room and teacher time they use is off
+    # limits. A meeting counts as placed only when all its periods are
+    # manual; the rest of a partly manual meeting is completed next to the
+    # manual periods with the same teacher and room. Courses placed entirely
+    # by hand drop out of the model
+    pinned = {}
+    pinned_rows = scoped_entries_query(institution_id, department_id).filter(
+        TimetableEntry.is_manual == True  # noqa: E712
+    ).with_entities(
+        TimetableEntry.course_id, TimetableEntry.teacher_id, TimetableEntry.room_id, TimetableEntry.timeslot_id
+    ).order_by(TimetableEntry.id)
+    for course_id, teacher_id, room_id, timeslot_id in pinned_rows:
+        pinned.setdefault(course_id, []).append((teacher_id, room_id, timeslot_id))
+        blocked.add((room_id, timeslot_id))
+        unavailable.setdefault(teacher_id, set()).add(timeslot_id)
+    positions = {timeslot.id: position for position, timeslot in enumerate(timeslots)}
+    meetings = {
+        course.id: _pinned_meetings(pinned[course.id], _blocks(timeslots, course.block_length), positions)
+        for course in courses if course.id in pinned
+    }
+    partly_manual = [
+        course.id for course in courses
+        if any(len(meeting) < course.block_length for meeting in meetings.get(course.id, ()))
+    ]
+    stored = set()
+    if partly_manual:
+        stored = set(scoped_entries_query(institution_id, department_id, include_manual=False).filter(
+            TimetableEntry.course_id.in_(partly_manual)
+        ).with_entities(
+            TimetableEntry.course_id, TimetableEntry.teacher_id, TimetableEntry.room_id, TimetableEntry.timeslot_id
+        ))
+
+    completions = {}
+    pin_conflicts = []
+    unpinned_courses = []
+    for course in courses:
+        if course.id in meetings:
+            blocks = _blocks(timeslots, course.block_length)
+            for meeting in meetings[course.id]:
+                if len(meeting) == course.block_length:
+                    continue
+                teacher_id = meeting[0][0]
+                completion = _complete_meeting(
+                    meeting, blocks, blocked, unavailable.get(teacher_id, set()),
+                    {entry[1:] for entry in stored if entry[0] == course.id}
+                )
+                if completion is None:
+                    pin_conflicts.append(
+                        f"Course {course.name} has {len(meeting)} of a {course.block_length} period meeting "
+                        f"placed manually, and the rest does not fit next to them with the same teacher and room"
+                    )
+                    continue
+                completions.setdefault(course.id, []).extend(completion)
+                pinned[course.id].extend(completion)
+                for _, room_id, timeslot_id in completion:
+                    blocked.add((room_id, timeslot_id))
+                    unavailable.setdefault(teacher_id, set()).add(timeslot_id)
+            sessions = course.sessions - len(meetings[course.id])
+            if sessions <= 0:
+                continue
+            course = replace(course, sessions=sessions)
+        unpinned_courses.append(course)
+    courses = unpinned_courses
+
+    current = {}
+    if with_current:
+        current_rows = scoped_entries_query(institution_id, department_id, include_manual=False).with_entities(
+            TimetableEntry.course_id, TimetableEntry.teacher_id, TimetableEntry.room_id, TimetableEntry.timeslot_id
+        ).order_by(TimetableEntry.id)
+        for course_id, teacher_id, room_id, timeslot_id in current_rows:
+            if (teacher_id, room_id, timeslot_id) in completions.get(course_id, ()):
+                continue
+            current.setdefault(course_id, []).append((teacher_id, room_id, timeslot_id))
+
+    rules = dict(db.session.query(InstitutionRule.rule_name, InstitutionRule.rule_value).filter(
+        InstitutionRule.institution_id == institution_id
+    ))
+
+    return SchedulingSnapshot(
+        institution_id=institution_id,
+        department_id=department_id,
+        courses=courses,
+        teachers=teachers,
+        rooms=rooms,
+        timeslots=timeslots,
+        unavailable=unavailable,
+        rules=rules,
+        blocked=blocked,
+        current=current,
+        pinned=pinned,
+        completions=completions,
+        pin_conflicts=pin_conflicts
+    )
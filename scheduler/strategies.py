@@ -0,0 +1,38 @@
+from typing import Any, Dict
+from models import InstitutionRule
+from .decomposition import DepartmentDecomposer
+from .lns import LnsScheduler
+from .timetable_engine import TimetableScheduler
+
+# Generation strategies selectable per run or through the
+# 'generation_strategy' institution rule
+STRATEGIES = {
+    'monolithic': TimetableScheduler,
+    'by_department': DepartmentDecomposer,
+    'lns': LnsScheduler,
+}
+DEFAULT_STRATEGY = 'monolithic'
+
+
+def resolve_strategy(institution_id: int, strategy: str = None) -> str:
+    """Pick the requested strategy, else the institution's rule, else the default"""
+    if strategy in STRATEGIES:
+        return strategy
+    rule = InstitutionRule.query.filter_by(
+        institution_id=institution_id, rule_name='generation_strategy'
+    ).first()
+    if rule and rule.rule_value in STRATEGIES:
+        return rule.rule_value
+    return DEFAULT_STRATEGY
+
+
+def create_scheduler(institution_id: int, strategy: str = None, **kwargs) -> TimetableScheduler:
+    """Instantiate the scheduler class for a generation strategy"""
+    return STRATEGIES[resolve_strategy(institution_id, strategy)](institution_id, **kwargs)
+
+
+def generate_timetable_for_institution(institution_id: int, department_id: int = None,
+                                       strategy: str = None, incremental: bool = False) -> Dict[str, Any]:
+    """Generate timetable for an institution"""
+    scheduler = create_scheduler(institution_id, strategy)
+    return scheduler.generate_timetable(department_id, incremental)
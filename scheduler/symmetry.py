@@ -0,0 +1,37 @@
+from typing import List
+from .snapshot import RoomData, SchedulingSnapshot, TeacherData
+
+
+def room_classes(snapshot: SchedulingSnapshot) -> List[List[RoomData]]:
+    """Groups of interchangeable rooms, each sorted by id.
+
+    Rooms are interchangeable when they have the same capacity, type and
+    building and the same timeslots are taken in them outside this run, so
+    swapping their classes changes neither feasibility nor the objective.
+    """
+    blocked = {}
+    for room_id, timeslot_id in snapshot.blocked:
+        blocked.setdefault(room_id, set()).add(timeslot_id)
+    classes = {}
+    for room in sorted(snapshot.rooms, key=lambda room: room.id):
+        key = (room.capacity, room.room_type, room.building, frozenset(blocked.get(room.id, ())))
+        classes.setdefault(key, []).append(room)
+    return [rooms for rooms in classes.values() if len(rooms) > 1]
+
+
+def teacher_classes(snapshot: SchedulingSnapshot) -> List[List[TeacherData]]:
+    """Groups of interchangeable teachers, each sorted by id.
+
+    Teachers are interchangeable when they belong to the same department,
+    are unavailable in the same timeslots and have the same weekly cap.
+    Teachers with manually placed classes are left out, since those tie
+    them to particular rooms.
+    """
+    pinned = {teacher_id for assignments in snapshot.pinned.values() for teacher_id, _, _ in assignments}
+    classes = {}
+    for teacher in sorted(snapshot.teachers, key=lambda teacher: teacher.id):
+        if teacher.id in pinned:
+            continue
+        key = (teacher.department_id, frozenset(snapshot.unavailable.get(teacher.id, ())), teacher.max_hours_per_week)
+        classes.setdefault(key, []).append(teacher)
+    return [teachers for teachers in classes.values() if len(teachers) > 1]
@@ -1,74 +1,109 @@
 from ortools.sat.python import cp_model
-from typing import List, Dict, Any, Tuple
-from models import Course, Teacher, Room, TimeSlot, TimetableEntry, FacultyAvailability
+from typing import List, Dict, Any, Iterable, Tuple
 from app import db
+from contextlib import contextmanager
+from .incremental import count_moves, neighbourhoods, valid_current_assignments
+from .persistence import replace_timetable
+from .progress import ProgressHandler, SolutionRecorder
+from .objective import ObjectiveWeights
+from .screening import screen_snapshot
+from .rules import SchedulingRules, break_pairs, lunch_windows, timeslots_by_day
+from .settings import SolverSettings, describe_solve
+from .snapshot import SchedulingSnapshot, load_snapshot, room_suits_course
+from .symmetry import room_classes, teacher_classes
+from .variable_store import VariableStore
 import logging
+import math
+import statistics
+import time
+
+# Objective weight of every meeting of an optional course left unplaced, large
+# enough to dominate the soft constraints
+UNPLACED_WEIGHT = 100000
 
 class TimetableScheduler:
-    def __init__(self, institution_id: int):
+    def __init__(self, institution_id: int, settings: SolverSettings = None,
+                 on_progress: ProgressHandler = None):
         self.institution_id = institution_id
+        self.settings = settings
+        self.on_progress = on_progress
+        self.stop_requested = False
         self.model = cp_model.CpModel()
         self.solver = cp_model.CpSolver()
-        self.variables = {}
+        self.variables = VariableStore(self.model)
         self.conflicts = []
+        self.stats = {'timings': {}}
+        self.unplaceable_courses = []
+        self.objective_terms = {}
+        self.optional_courses = set()
+        self.explain = False
+        self.explain_failures = True
+        self.assumptions = {}
+        self.room_pools = {}
+        self._teacher_slots = None
+        self._started = None
+    
+    def request_stop(self):
+        """Stop the search and keep the best solution found so far.
         
-    def generate_timetable(self, department_id: int = None) -> Dict[str, Any]:
-        """Generate timetable using constraint satisfaction"""
+        Safe to call from another thread while generate_timetable is solving.
+        """
+        self.stop_requested = True
+        self.solver.StopSearch()
+    
+    def _on_solution(self, record: Dict[str, Any], history: List[Dict[str, Any]]):
+        """Forward an improving solution and honour stop requests made before the solve began"""
+        if self.on_progress:
+            self.on_progress(record, history)
+        if self.stop_requested:
+            self.recorder.StopSearch()
+    
+    @contextmanager
+    def _timed(self, phase: str):
+        """Record the wall time of a generation phase in stats['timings']"""
+        started = time.perf_counter()
         try:
-            # Clear existing timetable entries for this institution/department
-            query = TimetableEntry.query.filter_by(institution_id=self.institution_id)
-            if department_id:
-                query = query.join(Course).filter(Course.department_id == department_id)
-            query.delete(synchronize_session=False)
-            db.session.commit()
-            
-            # Get data
-            courses = self._get_courses(department_id)
-            teachers = self._get_teachers(department_id)
-            rooms = self._get_rooms()
-            timeslots = self._get_timeslots()
-            
-            if not courses or not teachers or not rooms or not timeslots:
-                return {
-                    'success': False,
-                    'message': 'Insufficient data to generate timetable. Please ensure you have courses, teachers, rooms, and timeslots configured.',
-                    'conflicts': []
-                }
-            
-            # Create variables
-            self._create_variables(courses, teachers, rooms, timeslots)
-            
-            # Add constraints
-            self._add_basic_constraints(courses, teachers, rooms, timeslots)
-            self._add_availability_constraints(teachers, timeslots)
-            self._add_capacity_constraints(courses, rooms)
+            yield
+        finally:
+            self.stats['timings'][phase] = round(time.perf_counter() - started, 4)
+        
+    def _reset_model(self):
+        """Start a fresh model and solver for another solve in the same run"""
+        self.model = cp_model.CpModel()
+        self.solver = cp_model.CpSolver()
+        self.variables = VariableStore(self.model)
+        self.conflicts = []
+        self.objective_terms = {}
+        self.assumptions = {}
+        self.room_pools = {}
+        self._teacher_slots = None
+        
+    def generate_timetable(self, department_id: int = None, incremental: bool = False) -> Dict[str, Any]:
+        """Generate timetable using constraint satisfaction.
+        
+        An incremental run keeps the stored timetable as far as possible and
+        only re-solves the classes affected by data changes since.
+        """
+        self._started = time.perf_counter()
+        try:
+            # Get data. The existing timetable stays in place until a new one
+            # has been solved, so readers never see an empty timetable.
+            with self._timed('load'):
+                snapshot = load_snapshot(self.institution_id, department_id, with_current=incremental)
+                # Release the read transaction before the long solve
+                db.session.commit()
             
-            # Solve
-            status = self.solver.Solve(self.model)
+            result = self.solve_snapshot(snapshot, incremental)
+            if not result['success']:
+                return result
             
-            if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-                # Extract solution
-                timetable_entries = self._extract_solution(courses, teachers, rooms, timeslots)
-                
-                # Save to database
-                for entry_data in timetable_entries:
-                    entry = TimetableEntry(**entry_data)
-                    db.session.add(entry)
-                
-                db.session.commit()
-                
-                return {
-                    'success': True,
-                    'message': f'Timetable generated successfully with {len(timetable_entries)} classes scheduled.',
-                    'conflicts': self.conflicts,
-                    'entries_count': len(timetable_entries)
-                }
-            else:
-                return {
-                    'success': False,
-                    'message': 'Could not generate a feasible timetable with current constraints.',
-                    'conflicts': self._detect_conflicts(courses, teachers, rooms, timeslots)
-                }
+            # Swap the new entries in for the old ones atomically
+            timetable_entries = result.pop('entries') + self._completion_entries(snapshot)
+            with self._timed('persist'):
+                self.stats['persist'] = replace_timetable(
+                    self.institution_id, department_id, timetable_entries
+                )
+            return result
                 
         except Exception as e:
             db.session.rollback()
@@ -79,141 +114,827 @@ class TimetableScheduler:
                 'conflicts': []
             }
     
-    def _get_courses(self, department_id: int = None) -> List[Course]:
-        """Get courses for scheduling"""
-        query = Course.query.filter_by(institution_id=self.institution_id)
-        if department_id:
-            query = query.filter_by(department_id=department_id)
-        return query.all()
-    
-    def _get_teachers(self, department_id: int = None) -> List[Teacher]:
-        """Get teachers for scheduling"""
-        query = Teacher.query.filter_by(institution_id=self.institution_id)
-        if department_id:
-            query = query.filter_by(department_id=department_id)
-        return query.all()
-    
-    def _get_rooms(self) -> List[Room]:
-        """Get rooms for scheduling"""
-        return Room.query.filter_by(institution_id=self.institution_id).all()
-    
-    def _get_timeslots(self) -> List[TimeSlot]:
-        """Get timeslots for scheduling"""
-        return TimeSlot.query.filter_by(institution_id=self.institution_id).order_by(
-            TimeSlot.day_of_week, TimeSlot.start_time
-        ).all()
-    
-    def _create_variables(self, courses: List[Course], teachers: List[Teacher], 
-                         rooms: List[Room], timeslots: List[TimeSlot]):
-        """Create decision variables"""
-        for course in courses:
-            for teacher in teachers:
-                # Only allow teachers from same department
-                if teacher.department_id != course.department_id:
-                    continue
-                    
-                for room in rooms:
-                    for timeslot in timeslots:
-                        var_name = f"schedule_{course.id}_{teacher.id}_{room.id}_{timeslot.id}"
-                        self.variables[var_name] = self.model.NewBoolVar(var_name)
+    def solve_snapshot(self, snapshot: SchedulingSnapshot, incremental: bool = False) -> Dict[str, Any]:
+        """Build and solve the model for a snapshot without touching the database.
+        
+        On success the result carries the solved entries under 'entries'.
+        """
+        if self._started is None:
+            self._started = time.perf_counter()
+        self.stats['pinned'] = snapshot.pinned_count()
+        if snapshot.pin_conflicts:
+            return self._screen(snapshot)
+        
+        if not snapshot.courses and snapshot.pinned:
+            return {
+                'success': True,
+                'message': 'Every course is placed manually, nothing to generate.',
+                'conflicts': [],
+                'entries_count': 0,
+                'entries': [],
+                'stats': self.stats
+            }
+        
+        if snapshot.is_empty():
+            return {
+                'success': False,
+                'message': 'Insufficient data to generate timetable. Please ensure you have courses, teachers, rooms, and timeslots configured.',
+                'conflicts': []
+            }
+        
+        if self.settings is None:
+            self.settings = SolverSettings.from_rules(snapshot.rules)
+        
+        screening = self._screen(snapshot)
+        if screening:
+            return screening
+        
+        if incremental:
+            result = self._solve_incremental(snapshot)
+        else:
+            result = self._generate(snapshot)
+        if result['success'] and self.stats['pinned']:
+            result['message'] += f" {self.stats['pinned']} manually placed classes were kept."
+        return result
+    
+    def _screen(self, snapshot: SchedulingSnapshot) -> Dict[str, Any]:
+        """Failure result for a snapshot that is certainly infeasible, None otherwise"""
+        with self._timed('screening'):
+            reasons = screen_snapshot(snapshot)
+        if not reasons:
+            return None
+        return {
+            'success': False,
+            'message': 'The timetable cannot be generated with the current data.',
+            'conflicts': reasons,
+            'stats': self.stats
+        }
     
-    def _add_basic_constraints(self, courses: List[Course], teachers: List[Teacher],
-                              rooms: List[Room], timeslots: List[TimeSlot]):
-        """Add basic scheduling constraints"""
+    def _generate(self, snapshot: SchedulingSnapshot) -> Dict[str, Any]:
+        """Solve every course from scratch as one model"""
+        return self._solve(snapshot)
+    
+    def _solve_incremental(self, snapshot: SchedulingSnapshot) -> Dict[str, Any]:
+        """Re-solve the neighbourhood of changed classes, keeping the rest fixed.
         
-        # Each course must be assigned exactly once
-        for course in courses:
-            course_vars = []
-            for teacher in teachers:
-                if teacher.department_id != course.department_id:
+        Classes outside the neighbourhood keep their stored assignment. Inside
+        it, stored assignments are used as solver hints and moving one costs
+        a penalty. If the neighbourhood cannot be solved it is widened.
+        """
+        kept = valid_current_assignments(snapshot)
+        stages = neighbourhoods(snapshot, kept)
+        
+        for stage, free_courses in enumerate(stages, start=1):
+            if stage > 1:
+                self._reset_model()
+            fixed = {course_id: a for course_id, a in kept.items() if course_id not in free_courses}
+            preferred = {course_id: a for course_id, a in kept.items() if course_id in free_courses}
+            result = self._solve(snapshot, fixed, preferred)
+            
+            self.stats['incremental'] = {
+                'stage': stage,
+                'stages': len(stages),
+                'kept': len(kept),
+                'fixed': len(fixed),
+                'reoptimised': len(free_courses),
+                'moved': count_moves(result['entries'], snapshot.current) if result['success'] else None
+            }
+            if result['success'] or self.stop_requested:
+                break
+        
+        if result['success']:
+            result['message'] = (f"Timetable updated with {result['entries_count']} classes scheduled: "
+                                 f"{len(free_courses)} re-optimised, {self.stats['incremental']['moved']} moved.")
+        return result
+    
+    def _solve(self, snapshot: SchedulingSnapshot, fixed: Dict[int, List[Tuple[int, int, int]]] = None,
+               preferred: Dict[int, List[Tuple[int, int, int]]] = None) -> Dict[str, Any]:
+        """Build and solve one model, optionally pinning or preferring assignments"""
+        # Full solves give each group of identical rooms one set of variables
+        # and spread its classes over the rooms of the group afterwards
+        full_solve = not fixed and not preferred and not self.optional_courses and not self.explain
+        self.room_pools = {rooms[0].id: rooms for rooms in room_classes(snapshot)} if full_solve else {}
+        
+        # Create variables
+        with self._timed('variables'):
+            self._create_variables(snapshot, fixed)
+        
+        if self.unplaceable_courses:
+            return {
+                'success': False,
+                'message': 'Some courses have no suitable teacher, room and timeslot combination.',
+                'conflicts': [
+                    f"Course {course.name} has no available teacher, suitable room and free timeslot"
+                    for course in self.unplaceable_courses
+                ],
+                'stats': self.stats
+            }
+        
+        # Add constraints
+        with self._timed('constraints'):
+            self._add_basic_constraints(snapshot)
+            self._add_rule_constraints(snapshot)
+            if full_solve:
+                self._add_symmetry_breaking(snapshot)
+            weights = ObjectiveWeights.from_rules(snapshot.rules)
+            self._add_objective_terms(snapshot, weights)
+            if preferred:
+                self._prefer_assignments(preferred, weights.moved)
+            if self.optional_courses:
+                self._add_unplaced_term(snapshot)
+            if self.objective_terms:
+                self.model.Minimize(cp_model.LinearExpr.WeightedSum(
+                    [expression for _, expression in self.objective_terms.values()],
+                    [weight for weight, _ in self.objective_terms.values()]
+                ))
+        self.stats['constraint_count'] = len(self.model.Proto().constraints)
+        
+        # Solve within the institution's search budget
+        self.settings.apply(self.solver)
+        self.recorder = SolutionRecorder(
+            self.variables.literals, self.model.HasObjective(), self._on_solution
+        )
+        with self._timed('solve'):
+            status = self.solver.Solve(self.model, self.recorder)
+        self.stats['solver'] = describe_solve(self.solver, status, self.settings, self.stop_requested)
+        self.stats['solutions'] = len(self.recorder.solutions)
+        
+        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+            if self.objective_terms:
+                self.stats['objective'] = self._objective_breakdown()
+            timetable_entries = self._extract_solution(snapshot)
+            return {
+                'success': True,
+                'message': f'Timetable generated successfully with {len(timetable_entries)} classes scheduled.',
+                'conflicts': self.conflicts,
+                'entries_count': len(timetable_entries),
+                'entries': timetable_entries,
+                'stats': self.stats
+            }
+        
+        message = 'Could not generate a feasible timetable with current constraints.'
+        if status == cp_model.UNKNOWN and self.stop_requested:
+            message = 'Generation was stopped before any timetable was found.'
+        elif status == cp_model.UNKNOWN and 'time_limit' in self.stats['solver']['limits_hit']:
+            message = (f'No timetable was found within the {self.settings.max_time_seconds:g} '
+                       f'second solve time limit.')
+        # A proven infeasibility gets the minimal set of requirements causing it
+        conflicts = []
+        if status == cp_model.INFEASIBLE and self.explain_failures and not fixed and self._time_left() != 0:
+            self.stats['explanation'] = self.explain_infeasibility(snapshot)
+            conflicts = [requirement['description'] for requirement in self.stats['explanation']]
+            if conflicts:
+                message = f'The timetable is infeasible: these {len(conflicts)} requirements cannot all be met.'
+        return {
+            'success': False,
+            'message': message,
+            'conflicts': conflicts or self._detect_conflicts(snapshot),
+            'stats': self.stats
+        }
+    
+    def _create_variables(self, snapshot: SchedulingSnapshot, fixed: Dict[int, List[Tuple[int, int, int]]] = None):
+        """Create decision variables for feasible candidates only.
+        
+        A variable means the course meets with that teacher in that room for
+        a block of periods starting at that timeslot. Rooms that are too
+        small or of the wrong type, blocks touching a timeslot in which the
+        teacher is unavailable and room/timeslot pairs already taken outside
+        this run never get a variable, so no constraints are needed later to
+        switch them off. Fixed courses only get variables for their stored
+        blocks, and the room and teacher time those take is closed to every
+        other course. Of each room pool only the first room gets variables.
+        """
+        fixed = fixed or {}
+        blocks_by_length = {length: snapshot.blocks(length)
+                            for length in {course.block_length for course in snapshot.courses}}
+        blocked = set(snapshot.blocked)
+        busy_teacher_slots = set()
+        for course in snapshot.courses:
+            for teacher_id, room_id, timeslot_id in fixed.get(course.id, ()):
+                for covered_id in blocks_by_length[course.block_length].get(timeslot_id, [timeslot_id]):
+                    blocked.add((room_id, covered_id))
+                    busy_teacher_slots.add((teacher_id, covered_id))
+        
+        teachers_by_department = snapshot.teachers_by_department()
+        open_slots_by_teacher = {
+            teacher.id: {ts.id for ts in snapshot.timeslots
+                         if ts.id not in snapshot.unavailable.get(teacher.id, ())
+                         and (teacher.id, ts.id) not in busy_teacher_slots}
+            for teacher in snapshot.teachers
+        }
+        open_starts_cache = {}
+        pooled_rooms = {room.id for rooms in self.room_pools.values() for room in rooms[1:]}
+        full_count = 0
+        self.unplaceable_courses = []
+        
+        for course in snapshot.courses:
+            course_teachers = teachers_by_department.get(course.department_id, [])
+            suitable_rooms = [r for r in snapshot.rooms
+                              if room_suits_course(course, r) and r.id not in pooled_rooms]
+            blocks = blocks_by_length[course.block_length]
+            full_count += len(course_teachers) * len(snapshot.rooms) * len(snapshot.timeslots)
+            course_var_count = 0
+            
+            if course.id in fixed:
+                for assignment in fixed[course.id]:
+                    self.variables.add(course.id, *assignment)
+                continue
+            
+            for teacher in course_teachers:
+                cache_key = (teacher.id, course.block_length)
+                if cache_key not in open_starts_cache:
+                    open_slots = open_slots_by_teacher[teacher.id]
+                    open_starts_cache[cache_key] = [
+                        start_id for start_id, covered in blocks.items()
+                        if all(slot_id in open_slots for slot_id in covered)
+                    ]
+                open_starts = open_starts_cache[cache_key]
+                
+                for room in suitable_rooms:
+                    if course.block_length == 1:
+                        free_starts = [start_id for start_id in open_starts if (room.id, start_id) not in blocked]
+                    else:
+                        free_starts = [
+                            start_id for start_id in open_starts
+                            if not any((room.id, slot_id) in blocked for slot_id in blocks[start_id])
+                        ]
+                    for start_id in free_starts:
+                        self.variables.add(course.id, teacher.id, room.id, start_id)
+                        course_var_count += 1
+            
+            if course_var_count == 0 and course.id not in self.optional_courses:
+                self.unplaceable_courses.append(course)
+        
+        if self.explain:
+            self._add_relaxed_variables(snapshot, fixed, blocked, busy_teacher_slots)
+        
+        self.stats['full_variable_count'] = full_count
+        self.stats['variable_count'] = len(self.variables)
+        self.stats['session_count'] = sum(course.sessions for course in snapshot.courses)
+        logging.info(
+            f"Scheduler variables for institution {self.institution_id}: "
+            f"{len(self.variables)} created out of {full_count} possible combinations"
+        )
+    
+    def _add_basic_constraints(self, snapshot: SchedulingSnapshot):
+        """Add basic scheduling constraints from one pass over the variables"""
+        literals = self.variables.literals
+        courses = {course.id: course for course in snapshot.courses}
+        by_course, by_course_teacher, by_room_slot, by_teacher_slot = self.variables.group_by_many(
+            ('course',), ('course', 'teacher'), ('room', 'timeslot'), ('teacher', 'timeslot')
+        )
+        
+        # Each course meets the required number of times a week, optional
+        # courses at most that often
+        for (course_id,), indices in by_course.items():
+            sessions = courses[course_id].sessions
+            optional = course_id in self.optional_courses
+            if sessions == 1 and optional:
+                constraint = self.model.AddAtMostOne(literals[i] for i in indices)
+            elif sessions == 1:
+                constraint = self.model.AddExactlyOne(literals[i] for i in indices)
+            elif optional:
+                constraint = self.model.Add(cp_model.LinearExpr.Sum([literals[i] for i in indices]) <= sessions)
+            else:
+                constraint = self.model.Add(cp_model.LinearExpr.Sum([literals[i] for i in indices]) == sessions)
+            self._require(constraint, ('course', course_id))
+        
+        self._add_session_constraints(snapshot, courses, by_course, by_course_teacher)
+        self._add_resource_constraints(snapshot, courses, by_room_slot, by_teacher_slot)
+    
+    def _add_session_constraints(self, snapshot: SchedulingSnapshot, courses: Dict[int, Any],
+                                 by_course: Dict[Tuple[int, ...], List[int]],
+                                 by_course_teacher: Dict[Tuple[int, ...], List[int]]):
+        """Keep a course's weekly meetings with one teacher and spread over the week"""
+        literals = self.variables.literals
+        timeslot_column = self.variables.columns['timeslot']
+        timeslot_days = {ts.id: ts.day_of_week for ts in snapshot.timeslots}
+        day_count = max(1, snapshot.day_count())
+        teacher_groups = {}
+        for (course_id, _), indices in by_course_teacher.items():
+            teacher_groups.setdefault(course_id, []).append(indices)
+        
+        for (course_id,), indices in by_course.items():
+            sessions = courses[course_id].sessions
+            if sessions == 1:
+                continue
+            
+            # Every meeting of a course is taught by the same teacher
+            groups = teacher_groups[course_id]
+            if len(groups) > 1:
+                teaches = [self.model.NewBoolVar('') for _ in groups]
+                self.model.AddExactlyOne(teaches)
+                for group, teacher_literal in zip(groups, teaches):
+                    meetings = cp_model.LinearExpr.Sum([literals[i] for i in group])
+                    if course_id in self.optional_courses:
+                        constraint = self.model.Add(meetings <= sessions * teacher_literal)
+                    else:
+                        constraint = self.model.Add(meetings == sessions * teacher_literal)
+                    self._require(constraint, ('course', course_id))
+            
+            # No more meetings on one day than spreading them evenly needs
+            per_day = math.ceil(sessions / day_count)
+            by_day = {}
+            for i in indices:
+                by_day.setdefault(timeslot_days[timeslot_column[i]], []).append(literals[i])
+            for day_literals in by_day.values():
+                if len(day_literals) <= per_day:
                     continue
-                for room in rooms:
-                    for timeslot in timeslots:
-                        var_name = f"schedule_{course.id}_{teacher.id}_{room.id}_{timeslot.id}"
-                        if var_name in self.variables:
-                            course_vars.append(self.variables[var_name])
+                if per_day == 1:
+                    constraint = self.model.AddAtMostOne(day_literals)
+                else:
+                    constraint = self.model.Add(cp_model.LinearExpr.Sum(day_literals) <= per_day)
+                self._require(constraint, ('course', course_id))
+    
+    def _add_resource_constraints(self, snapshot: SchedulingSnapshot, courses: Dict[int, Any],
+                                  by_room_slot: Dict[Tuple[int, ...], List[int]],
+                                  by_teacher_slot: Dict[Tuple[int, ...], List[int]]):
+        """No room or teacher hosts two classes at once.
+        
+        Single-period classes only need an at-most-one constraint per room or
+        teacher and timeslot. Rooms and teachers that may host a multi-period
+        block get one no-overlap constraint over optional interval variables
+        instead, one interval per block variable, so the model does not grow
+        with the number of periods a block covers. The first room of a pool
+        stands for all rooms of the pool, so it may host as many classes at
+        once as the pool has rooms.
+        """
+        literals = self.variables.literals
+        columns = self.variables.columns
+        block_rooms = set()
+        block_teachers = set()
+        for course_id, teacher_id, room_id in zip(columns['course'], columns['teacher'], columns['room']):
+            if courses[course_id].block_length > 1:
+                block_rooms.add(room_id)
+                block_teachers.add(teacher_id)
+        
+        if block_rooms:
+            positions = {ts.id: position for position, ts in enumerate(snapshot.timeslots)}
+            intervals = {}
             
-            if course_vars:
-                self.model.Add(sum(course_vars) == 1)
+            def interval(index: int):
+                if index not in intervals:
+                    course_id, _, _, timeslot_id = self.variables.tuple_at(index)
+                    intervals[index] = self.model.NewOptionalFixedSizeIntervalVar(
+                        positions[timeslot_id], courses[course_id].block_length, literals[index], ''
+                    )
+                return intervals[index]
+            
+            by_room, by_teacher = self.variables.group_by_many(('room',), ('teacher',))
+            for (room_id,), indices in by_room.items():
+                if room_id in self.room_pools:
+                    self.model.AddCumulative([interval(i) for i in indices], [1] * len(indices),
+                                             len(self.room_pools[room_id]))
+                elif room_id in block_rooms:
+                    self.model.AddNoOverlap([interval(i) for i in indices])
+            for (teacher_id,), indices in by_teacher.items():
+                if teacher_id in block_teachers:
+                    self.model.AddNoOverlap([interval(i) for i in indices])
         
         # No room conflicts - only one class per room per timeslot
-        for room in rooms:
-            for timeslot in timeslots:
-                room_timeslot_vars = []
-                for course in courses:
-                    for teacher in teachers:
-                        if teacher.department_id != course.department_id:
-                            continue
-                        var_name = f"schedule_{course.id}_{teacher.id}_{room.id}_{timeslot.id}"
-                        if var_name in self.variables:
-                            room_timeslot_vars.append(self.variables[var_name])
-                
-                if room_timeslot_vars:
-                    self.model.Add(sum(room_timeslot_vars) <= 1)
+        for (room_id, _), indices in by_room_slot.items():
+            if room_id in self.room_pools:
+                if room_id not in block_rooms and len(indices) > len(self.room_pools[room_id]):
+                    self.model.Add(cp_model.LinearExpr.Sum([literals[i] for i in indices])
+                                   <= len(self.room_pools[room_id]))
+            elif len(indices) > 1 and room_id not in block_rooms:
+                self.model.AddAtMostOne(literals[i] for i in indices)
         
         # No teacher conflicts - only one class per teacher per timeslot
-        for teacher in teachers:
-            for timeslot in timeslots:
-                teacher_timeslot_vars = []
-                for course in courses:
-                    if teacher.department_id != course.department_id:
+        for (teacher_id, _), indices in by_teacher_slot.items():
+            if len(indices) > 1 and teacher_id not in block_teachers:
+                self.model.AddAtMostOne(literals[i] for i in indices)
+    
+    def _add_symmetry_breaking(self, snapshot: SchedulingSnapshot):
+        """Rule out solutions that only differ by swapping interchangeable teachers.
+        
+        Identical teachers take courses in order: a course only goes to the
+        next teacher of a group once an earlier course went to the previous
+        one. Identical rooms need nothing here, since they are pooled.
+        """
+        literals = self.variables.literals
+        courses = {course.id: course for course in snapshot.courses}
+        by_course_teacher = self.variables.group_by('course', 'teacher')
+        
+        teacher_groups = teacher_classes(snapshot)
+        for teachers in teacher_groups:
+            department_courses = sorted(course.id for course in snapshot.courses
+                                        if course.department_id == teachers[0].department_id
+                                        and (course.id, teachers[0].id) in by_course_teacher)
+            if not department_courses:
+                continue
+            # teaches[t][i]: course i goes to teacher t; taken[t][i]: some course up to i does
+            teaches = []
+            taken = []
+            for teacher in teachers:
+                teacher_teaches = []
+                teacher_taken = []
+                for course_id in department_courses:
+                    literal = self.model.NewBoolVar('')
+                    self.model.Add(cp_model.LinearExpr.Sum(
+                        [literals[i] for i in by_course_teacher[(course_id, teacher.id)]]
+                    ) == courses[course_id].sessions * literal)
+                    any_so_far = self.model.NewBoolVar('')
+                    if teacher_taken:
+                        self.model.Add(any_so_far <= teacher_taken[-1] + literal)
+                    else:
+                        self.model.Add(any_so_far <= literal)
+                    teacher_teaches.append(literal)
+                    teacher_taken.append(any_so_far)
+                teaches.append(teacher_teaches)
+                taken.append(teacher_taken)
+            for previous, following in zip(range(len(teachers)), range(1, len(teachers))):
+                self.model.Add(teaches[following][0] == 0)
+                for i in range(1, len(department_courses)):
+                    self.model.Add(teaches[following][i] <= taken[previous][i - 1])
+        
+        self.stats['symmetry'] = {
+            'room_classes': len(self.room_pools),
+            'rooms': sum(len(rooms) for rooms in self.room_pools.values()),
+            'teacher_classes': len(teacher_groups),
+            'teachers': sum(len(teachers) for teachers in teacher_groups)
+        }
+    
+    def _teacher_slot_variables(self, snapshot: SchedulingSnapshot) -> Dict[Tuple[int, int], List[int]]:
+        """Indices of the variables whose meeting covers each (teacher, timeslot)"""
+        if self._teacher_slots is None:
+            columns = self.variables.columns
+            block_lengths = {course.id: course.block_length for course in snapshot.courses}
+            blocks_by_length = {length: snapshot.blocks(length) for length in set(block_lengths.values())}
+            self._teacher_slots = {}
+            for index, (course_id, teacher_id, start_id) in enumerate(
+                    zip(columns['course'], columns['teacher'], columns['timeslot'])):
+                for timeslot_id in blocks_by_length[block_lengths[course_id]].get(start_id, (start_id,)):
+                    self._teacher_slots.setdefault((teacher_id, timeslot_id), []).append(index)
+        return self._teacher_slots
+    
+    def _require(self, constraint, group: Tuple[str, int]):
+        """Make a constraint part of a requirement group, switched on by the group's assumption in explain mode"""
+        if not self.explain:
+            return
+        if group not in self.assumptions:
+            self.assumptions[group] = self.model.NewBoolVar('')
+        constraint.OnlyEnforceIf(self.assumptions[group])
+    
+    def _add_relaxed_variables(self, snapshot: SchedulingSnapshot, fixed: Dict[int, List[Tuple[int, int, int]]],
+                               blocked: set, busy_teacher_slots: set):
+        """Variables for unavailable teachers and unsuitable rooms, for explain mode.
+        
+        Each one is forced off by the teacher's availability or the room's
+        capacity and type requirement, so both can show up in an
+        infeasibility core when dropping them would help.
+        """
+        teachers_by_department = snapshot.teachers_by_department()
+        blocks_by_length = {length: snapshot.blocks(length)
+                            for length in {course.block_length for course in snapshot.courses}}
+        busy_teacher_slots = busy_teacher_slots | set(self._pinned_rooms(snapshot))
+        for course in snapshot.courses:
+            if course.id in fixed:
+                continue
+            for teacher in teachers_by_department.get(course.department_id, []):
+                unavailable = snapshot.unavailable.get(teacher.id, ())
+                for room in snapshot.rooms:
+                    suits = room_suits_course(course, room)
+                    for start_id, covered in blocks_by_length[course.block_length].items():
+                        if any((room.id, slot_id) in blocked or (teacher.id, slot_id) in busy_teacher_slots
+                               for slot_id in covered):
+                            continue
+                        away = any(slot_id in unavailable for slot_id in covered)
+                        if suits and not away:
+                            continue
+                        literal = self.variables.literals[self.variables.add(course.id, teacher.id, room.id, start_id)]
+                        if away:
+                            self._require(self.model.Add(literal == 0), ('availability', teacher.id))
+                        if not suits:
+                            self._require(self.model.Add(literal == 0), ('room', room.id))
+
+    def _pinned_rooms(self, snapshot: SchedulingSnapshot) -> Dict[Tuple[int, int], int]:
+        """Room of each manually placed (teacher, timeslot)"""
+        return {
+            (teacher_id, timeslot_id): room_id
+            for assignments in snapshot.pinned.values()
+            for teacher_id, room_id, timeslot_id in assignments
+        }
+    
+    def _add_rule_constraints(self, snapshot: SchedulingSnapshot):
+        """Compile the institution's teaching-load rules into constraints.
+        
+        Hour caps are linear sums over a teacher's day or week, the
+        consecutive-period limit is a sliding window over contiguous periods,
+        and breaks and the lunch break are sums over the meetings touching
+        adjacent periods. Manually placed classes count towards every limit.
+        """
+        rules = SchedulingRules.from_rules(snapshot.rules)
+        self.stats['rules'] = rules.to_dict()
+        literals = self.variables.literals
+        slot_minutes = {ts.id: ts.minutes for ts in snapshot.timeslots}
+        days = timeslots_by_day(snapshot)
+        by_teacher_slot = self._teacher_slot_variables(snapshot)
+        pinned_slots = set(self._pinned_rooms(snapshot))
+        teacher_ids = {teacher_id for teacher_id, _ in by_teacher_slot}
+        
+        def add_minutes_cap(teacher_id: int, timeslots: List[Any], cap: int, group: str):
+            """Teaching minutes of a teacher over the given timeslots stay within cap"""
+            terms = {}
+            pinned_minutes = 0
+            reachable = 0
+            for ts in timeslots:
+                indices = by_teacher_slot.get((teacher_id, ts.id), ())
+                if (teacher_id, ts.id) in pinned_slots:
+                    pinned_minutes += ts.minutes
+                elif indices:
+                    reachable += ts.minutes
+                for index in indices:
+                    terms[index] = terms.get(index, 0) + slot_minutes[ts.id]
+            if not terms or pinned_minutes + reachable <= cap:
+                return
+            self._require(self.model.Add(cp_model.LinearExpr.WeightedSum(
+                [literals[index] for index in terms], list(terms.values())
+            ) <= max(0, cap - pinned_minutes)), (group, teacher_id))
+        
+        for teacher in snapshot.teachers:
+            if teacher.id not in teacher_ids:
+                continue
+            weekly_cap = rules.weekly_minutes(teacher.max_hours_per_week)
+            if weekly_cap:
+                add_minutes_cap(teacher.id, snapshot.timeslots, weekly_cap, 'weekly_hours')
+            if rules.max_hours_per_day:
+                for day_slots in days.values():
+                    add_minutes_cap(teacher.id, day_slots, int(rules.max_hours_per_day * 60), 'daily_hours')
+        
+        # No more than max_consecutive periods in any window of contiguous periods
+        if rules.max_consecutive:
+            windows = list(snapshot.blocks(rules.max_consecutive + 1).values())
+            for teacher_id in teacher_ids:
+                for window in windows:
+                    terms = {}
+                    pinned = sum(1 for timeslot_id in window if (teacher_id, timeslot_id) in pinned_slots)
+                    busy = pinned
+                    for timeslot_id in window:
+                        indices = by_teacher_slot.get((teacher_id, timeslot_id), ())
+                        busy += 1 if indices else 0
+                        for index in indices:
+                            terms[index] = terms.get(index, 0) + 1
+                    if busy <= rules.max_consecutive:
                         continue
-                    for room in rooms:
-                        var_name = f"schedule_{course.id}_{teacher.id}_{room.id}_{timeslot.id}"
-                        if var_name in self.variables:
-                            teacher_timeslot_vars.append(self.variables[var_name])
-                
-                if teacher_timeslot_vars:
-                    self.model.Add(sum(teacher_timeslot_vars) <= 1)
-    
-    def _add_availability_constraints(self, teachers: List[Teacher], timeslots: List[TimeSlot]):
-        """Add teacher availability constraints"""
-        for teacher in teachers:
-            unavailable_slots = FacultyAvailability.query.filter_by(
-                teacher_id=teacher.id, is_available=False
-            ).all()
-            
-            for unavail in unavailable_slots:
-                for course_id in [c.id for c in Course.query.filter_by(
-                    department_id=teacher.department_id, institution_id=self.institution_id
-                ).all()]:
-                    for room_id in [r.id for r in Room.query.filter_by(
-                        institution_id=self.institution_id
-                    ).all()]:
-                        var_name = f"schedule_{course_id}_{teacher.id}_{room_id}_{unavail.timeslot_id}"
-                        if var_name in self.variables:
-                            self.model.Add(self.variables[var_name] == 0)
-    
-    def _add_capacity_constraints(self, courses: List[Course], rooms: List[Room]):
-        """Add room capacity constraints"""
-        for course in courses:
-            if course.student_count > 0:
-                for teacher_id in [t.id for t in Teacher.query.filter_by(
-                    department_id=course.department_id, institution_id=self.institution_id
-                ).all()]:
-                    for room in rooms:
-                        if room.capacity < course.student_count:
-                            for timeslot_id in [ts.id for ts in TimeSlot.query.filter_by(
-                                institution_id=self.institution_id
-                            ).all()]:
-                                var_name = f"schedule_{course.id}_{teacher_id}_{room.id}_{timeslot_id}"
-                                if var_name in self.variables:
-                                    self.model.Add(self.variables[var_name] == 0)
-    
-    def _extract_solution(self, courses: List[Course], teachers: List[Teacher],
-                         rooms: List[Room], timeslots: List[TimeSlot]) -> List[Dict]:
-        """Extract solution from solver"""
+                    self._require(self.model.Add(cp_model.LinearExpr.WeightedSum(
+                        [literals[index] for index in terms], list(terms.values())
+                    ) <= max(0, rules.max_consecutive - pinned)), ('consecutive', teacher_id))
+        
+        # Separate meetings of a teacher need a break between adjacent periods
+        # when back-to-back classes are off or the break is below the minimum gap
+        for first_id, second_id in break_pairs(snapshot, rules):
+            for teacher_id in teacher_ids:
+                first = by_teacher_slot.get((teacher_id, first_id), ())
+                second = by_teacher_slot.get((teacher_id, second_id), ())
+                first_pinned = (teacher_id, first_id) in pinned_slots
+                second_pinned = (teacher_id, second_id) in pinned_slots
+                if not (first or first_pinned) or not (second or second_pinned) or not (first or second):
+                    continue
+                pinned = first_pinned + second_pinned
+                touching = sorted(set(first) | set(second))
+                if pinned:
+                    constraint = self.model.Add(cp_model.LinearExpr.Sum([literals[i] for i in touching]) <= max(0, 1 - pinned))
+                else:
+                    constraint = self.model.AddAtMostOne(literals[i] for i in touching)
+                self._require(constraint, ('breaks', teacher_id))
+        
+        # Every teacher keeps a long enough lunch break free each day
+        if rules.lunch_break_minutes:
+            for day, day_slots in days.items():
+                windows = lunch_windows(day_slots, rules)
+                if windows is None:
+                    continue
+                if not windows:
+                    logging.warning(f"No {rules.lunch_break_minutes} minute lunch break fits on day {day}, rule ignored")
+                    continue
+                for teacher_id in teacher_ids:
+                    options = []
+                    for window in windows:
+                        if any((teacher_id, timeslot_id) in pinned_slots for timeslot_id in window):
+                            continue
+                        touching = sorted({index for timeslot_id in window
+                                           for index in by_teacher_slot.get((teacher_id, timeslot_id), ())})
+                        if not touching:
+                            options = None
+                            break
+                        options.append((window, touching))
+                    if not options:
+                        continue
+                    lunch_literals = []
+                    for window, touching in options:
+                        lunch = self.model.NewBoolVar('')
+                        self.model.Add(
+                            cp_model.LinearExpr.Sum([literals[i] for i in touching]) + len(window) * lunch <= len(window)
+                        )
+                        lunch_literals.append(lunch)
+                    self._require(self.model.AddBoolOr(lunch_literals), ('lunch', teacher_id))
+    
+    def _add_objective_terms(self, snapshot: SchedulingSnapshot, weights: ObjectiveWeights):
+        """Add the institution's weighted soft constraints as objective terms"""
+        literals = self.variables.literals
+        columns = self.variables.columns
+        courses = {course.id: course for course in snapshot.courses}
+        if weights.wasted_capacity:
+            capacities = {room.id: room.capacity for room in snapshot.rooms}
+            # Empty seats for every period of a meeting
+            waste = [
+                (capacities[room_id] - courses[course_id].student_count) * courses[course_id].block_length
+                for course_id, room_id in zip(columns['course'], columns['room'])
+            ]
+            self.objective_terms['wasted_capacity'] = (
+                weights.wasted_capacity, cp_model.LinearExpr.WeightedSum(literals, waste)
+            )
+        
+        if weights.late_slots:
+            late = {ts.id for ts in snapshot.timeslots if ts.start_time >= weights.late_slot_start}
+            blocks_by_length = {length: snapshot.blocks(length) for length in {c.block_length for c in courses.values()}}
+            late_periods = [
+                sum(1 for timeslot_id in blocks_by_length[courses[course_id].block_length].get(start_id, (start_id,))
+                    if timeslot_id in late)
+                for course_id, start_id in zip(columns['course'], columns['timeslot'])
+            ]
+            self.objective_terms['late_slots'] = (
+                weights.late_slots, cp_model.LinearExpr.WeightedSum(literals, late_periods)
+            )
+        
+        if weights.idle_gaps:
+            self.objective_terms['idle_gaps'] = (weights.idle_gaps, self._idle_gap_expression(snapshot))
+        
+        if weights.building_changes and len({room.building for room in snapshot.rooms}) > 1:
+            self.objective_terms['building_changes'] = (
+                weights.building_changes, self._building_change_expression(snapshot)
+            )
+    
+    def _occupancy(self, indices: List[int], pinned: bool):
+        """Linear expression for whether a teacher teaches in one timeslot"""
+        if pinned:
+            return 1
+        return cp_model.LinearExpr.Sum([self.variables.literals[i] for i in indices])
+    
+    def _idle_gap_expression(self, snapshot: SchedulingSnapshot):
+        """Free periods between a teacher's first and last class of each day.
+        
+        before[k] and after[k] mark that the teacher teaches at or before,
+        and at or after, the k-th period of the day. A period is idle when
+        the teacher teaches both before and after it but not in it.
+        """
+        by_teacher_slot = self._teacher_slot_variables(snapshot)
+        pinned_rooms = self._pinned_rooms(snapshot)
+        teacher_ids = {teacher_id for teacher_id, _ in by_teacher_slot}
+        gaps = []
+        for teacher_id in teacher_ids:
+            for day_slots in timeslots_by_day(snapshot).values():
+                periods = [
+                    (by_teacher_slot.get((teacher_id, ts.id), ()), (teacher_id, ts.id) in pinned_rooms)
+                    for ts in day_slots
+                ]
+                reachable = [k for k, (indices, pinned) in enumerate(periods) if indices or pinned]
+                if len(reachable) < 2 or reachable[-1] - reachable[0] < 2:
+                    continue
+                occupancy = [self._occupancy(indices, pinned)
+                             for indices, pinned in periods[reachable[0]:reachable[-1] + 1]]
+                before = [self.model.NewBoolVar('') for _ in occupancy]
+                after = [self.model.NewBoolVar('') for _ in occupancy]
+                for k, occupied in enumerate(occupancy):
+                    self.model.Add(before[k] >= occupied)
+                    self.model.Add(after[k] >= occupied)
+                    if k > 0:
+                        self.model.Add(before[k] >= before[k - 1])
+                        self.model.Add(after[k - 1] >= after[k])
+                for k in range(1, len(occupancy) - 1):
+                    gap = self.model.NewBoolVar('')
+                    self.model.Add(gap >= before[k - 1] + after[k + 1] - occupancy[k] - 1)
+                    gaps.append(gap)
+        return cp_model.LinearExpr.Sum(gaps)
+    
+    def _building_change_expression(self, snapshot: SchedulingSnapshot):
+        """Back-to-back pairs of a teacher's classes held in different buildings"""
+        by_teacher_slot = self._teacher_slot_variables(snapshot)
+        pinned_rooms = self._pinned_rooms(snapshot)
+        teacher_ids = {teacher_id for teacher_id, _ in by_teacher_slot}
+        literals = self.variables.literals
+        room_column = self.variables.columns['room']
+        buildings = {room.id: room.building for room in snapshot.rooms}
+        
+        def by_building(teacher_id: int, timeslot_id: int) -> Dict[Any, Any]:
+            """Occupancy of one teacher's timeslot split by building"""
+            pinned_room = pinned_rooms.get((teacher_id, timeslot_id))
+            if pinned_room is not None:
+                return {buildings.get(pinned_room): 1}
+            grouped = {}
+            for index in by_teacher_slot.get((teacher_id, timeslot_id), ()):
+                grouped.setdefault(buildings[room_column[index]], []).append(literals[index])
+            return {building: cp_model.LinearExpr.Sum(group) for building, group in grouped.items()}
+        
+        changes = []
+        for first_id, second_id in snapshot.blocks(2).values():
+            for teacher_id in teacher_ids:
+                first = by_building(teacher_id, first_id)
+                second = by_building(teacher_id, second_id)
+                if not first or not second or len(set(first) | set(second)) < 2:
+                    continue
+                change = self.model.NewBoolVar('')
+                second_occupied = sum(second.values())
+                # Teaching in building b first and then anywhere but b is a change
+                for building, first_occupied in first.items():
+                    self.model.Add(change >= first_occupied + second_occupied - second.get(building, 0) - 1)
+                changes.append(change)
+        return cp_model.LinearExpr.Sum(changes)
+    
+    def _objective_breakdown(self) -> Dict[str, Any]:
+        """Value of every objective term in the solution, for tuning weights"""
+        terms = {}
+        for name, (weight, expression) in self.objective_terms.items():
+            value = int(self.solver.Value(expression))
+            terms[name] = {'weight': weight, 'value': value, 'weighted': weight * value}
+        return {
+            'total': sum(term['weighted'] for term in terms.values()),
+            'best_bound': self.solver.BestObjectiveBound(),
+            'terms': terms
+        }
+    
+    def _prefer_assignments(self, preferred: Dict[int, List[Tuple[int, int, int]]], weight: int):
+        """Hint the solver with stored assignments and penalise moving them"""
+        preferred = {course_id: set(assignments) for course_id, assignments in preferred.items()}
+        kept_literals = []
+        for index, literal in enumerate(self.variables.literals):
+            course_id, teacher_id, room_id, timeslot_id = self.variables.tuple_at(index)
+            if (teacher_id, room_id, timeslot_id) in preferred.get(course_id, ()):
+                self.model.AddHint(literal, True)
+                kept_literals.append(literal)
+        
+        # Number of meetings moved away from their stored block
+        if weight:
+            self.objective_terms['moved'] = (weight, len(kept_literals) - cp_model.LinearExpr.Sum(kept_literals))
+    
+    def _add_unplaced_term(self, snapshot: SchedulingSnapshot):
+        """Penalise every meeting of an optional course that is left unplaced"""
+        sessions = {course.id: course.sessions for course in snapshot.courses if course.id in self.optional_courses}
+        placed = [literal for literal, course_id in zip(self.variables.literals, self.variables.columns['course'])
+                  if course_id in sessions]
+        self.objective_terms['unplaced'] = (
+            UNPLACED_WEIGHT, sum(sessions.values()) - cp_model.LinearExpr.Sum(placed)
+        )
+    
+    def _extract_solution(self, snapshot: SchedulingSnapshot) -> List[Dict]:
+        """Extract solution from solver, one entry per period of every meeting"""
+        meetings = self.variables.selected(self.solver)
+        if self.room_pools:
+            meetings = self._unpool_rooms(snapshot, meetings)
+        return self._build_entries(snapshot, meetings)
+    
+    def _unpool_rooms(self, snapshot: SchedulingSnapshot,
+                      meetings: Iterable[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+        """Move meetings placed in a pool's first room to concrete rooms of the pool.
+        
+        Meetings are handed out in order of their first period, each to a
+        room that is free again by then. Since no more meetings overlap than
+        the pool has rooms, this never runs out of rooms.
+        """
+        block_lengths = {course.id: course.block_length for course in snapshot.courses}
+        positions = {ts.id: position for position, ts in enumerate(snapshot.timeslots)}
+        unpooled = []
+        pooled = {}
+        for meeting in meetings:
+            if meeting[2] in self.room_pools:
+                pooled.setdefault(meeting[2], []).append(meeting)
+            else:
+                unpooled.append(meeting)
+        for pool_id, pool_meetings in pooled.items():
+            free_from = {room.id: 0 for room in self.room_pools[pool_id]}
+            for course_id, teacher_id, _, start_id in sorted(pool_meetings, key=lambda m: positions[m[3]]):
+                start = positions[start_id]
+                room_id = next(r for r, position in free_from.items() if position <= start)
+                free_from[room_id] = start + block_lengths[course_id]
+                unpooled.append((course_id, teacher_id, room_id, start_id))
+        return unpooled
+    
+    def _completion_entries(self, snapshot: SchedulingSnapshot) -> List[Dict]:
+        """Entries for the generated periods completing partly manual meetings"""
+        return [
+            {
+                'course_id': course_id,
+                'teacher_id': teacher_id,
+                'room_id': room_id,
+                'timeslot_id': timeslot_id,
+                'institution_id': self.institution_id,
+                'section': 'A',
+                'is_manual': False
+            }
+            for course_id, assignments in snapshot.completions.items()
+            for teacher_id, room_id, timeslot_id in assignments
+        ]
+    
+    def _build_entries(self, snapshot: SchedulingSnapshot,
+                       meetings: Iterable[Tuple[int, int, int, int]]) -> List[Dict]:
+        """Expand (course, teacher, room, starting timeslot) meetings into timetable entries"""
         timetable_entries = []
+        block_lengths = {course.id: course.block_length for course in snapshot.courses}
+        blocks_by_length = {length: snapshot.blocks(length) for length in set(block_lengths.values())}
         
-        for var_name, var in self.variables.items():
-            if self.solver.Value(var) == 1:
-                # Parse variable name
-                parts = var_name.split('_')
-                course_id = int(parts[1])
-                teacher_id = int(parts[2])
-                room_id = int(parts[3])
-                timeslot_id = int(parts[4])
-                
+        for course_id, teacher_id, room_id, start_id in meetings:
+            for timeslot_id in blocks_by_length[block_lengths[course_id]].get(start_id, [start_id]):
                 timetable_entries.append({
                     'course_id': course_id,
                     'teacher_id': teacher_id,
@@ -226,37 +947,141 @@ class TimetableScheduler:
         
         return timetable_entries
     
-    def _detect_conflicts(self, courses: List[Course], teachers: List[Teacher],
-                         rooms: List[Room], timeslots: List[TimeSlot]) -> List[str]:
+    def _detect_conflicts(self, snapshot: SchedulingSnapshot) -> List[str]:
         """Detect conflicts when no solution found"""
         conflicts = []
         
         # Check if there are enough rooms
-        total_classes = len(courses)
-        total_slots = len(timeslots) * len(rooms)
+        courses = snapshot.courses
+        total_classes = sum(c.sessions * c.block_length for c in courses)
+        total_slots = len(snapshot.timeslots) * len(snapshot.rooms)
         if total_classes > total_slots:
             conflicts.append(f"Not enough time slots: {total_classes} classes need {total_slots} slots")
         
         # Check teacher availability
-        for teacher in teachers:
+        for teacher in snapshot.teachers:
             teacher_courses = [c for c in courses if c.department_id == teacher.department_id]
-            unavailable_count = FacultyAvailability.query.filter_by(
-                teacher_id=teacher.id, is_available=False
-            ).count()
-            available_slots = len(timeslots) - unavailable_count
+            teacher_periods = sum(c.sessions * c.block_length for c in teacher_courses)
+            unavailable_count = len(snapshot.unavailable.get(teacher.id, ()))
+            available_slots = len(snapshot.timeslots) - unavailable_count
             
-            if len(teacher_courses) > available_slots:
-                conflicts.append(f"Teacher {teacher.name} has {len(teacher_courses)} courses but only {available_slots} available slots")
+            if teacher_periods > available_slots:
+                conflicts.append(f"Teacher {teacher.name} has {len(teacher_courses)} courses needing {teacher_periods} periods but only {available_slots} available slots")
         
         # Check room capacity
         for course in courses:
-            suitable_rooms = [r for r in rooms if r.capacity >= course.student_count]
+            suitable_rooms = [r for r in snapshot.rooms if room_suits_course(course, r)]
             if not suitable_rooms:
-                conflicts.append(f"Course {course.name} has {course.student_count} students but no room has sufficient capacity")
+                if course.room_type:
+                    conflicts.append(f"Course {course.name} needs a {course.room_type} room for {course.student_count} students but none is available")
+                else:
+                    conflicts.append(f"Course {course.name} has {course.student_count} students but no room has sufficient capacity")
+            elif course.block_length > 1 and not snapshot.blocks(course.block_length):
+                conflicts.append(f"Course {course.name} needs {course.block_length} consecutive periods but no day has that many")
+        
+        # Check teaching-load rules
+        rules = SchedulingRules.from_rules(snapshot.rules)
+        for course in courses:
+            if rules.max_consecutive and course.block_length > rules.max_consecutive:
+                conflicts.append(f"Course {course.name} meets for {course.block_length} consecutive periods but at most {rules.max_consecutive} are allowed")
+        
+        slot_minutes = statistics.median(ts.minutes for ts in snapshot.timeslots) if snapshot.timeslots else 0
+        for department_id, department_teachers in snapshot.teachers_by_department().items():
+            needed = sum(c.sessions * c.block_length for c in courses if c.department_id == department_id) * slot_minutes
+            caps = [rules.weekly_minutes(t.max_hours_per_week) for t in department_teachers]
+            if caps and all(caps) and needed > sum(caps):
+                conflicts.append(f"Department {department_id} needs {needed / 60:.1f} teaching hours a week but its teachers may teach at most {sum(caps) / 60:.1f}")
         
         return conflicts
-
-def generate_timetable_for_institution(institution_id: int, department_id: int = None) -> Dict[str, Any]:
-    """Generate timetable for an institution"""
-    scheduler = TimetableScheduler(institution_id)
-    return scheduler.generate_timetable(department_id)
+    
+    def _time_left(self) -> float:
+        """Seconds of the time limit left since generation started, None without a limit"""
+        if self.settings.max_time_seconds <= 0:
+            return None
+        started = self._started if self._started is not None else time.perf_counter()
+        return max(0.0, self.settings.max_time_seconds - (time.perf_counter() - started))
+    
+    def explain_infeasibility(self, snapshot: SchedulingSnapshot,
+                              fixed: Dict[int, List[Tuple[int, int, int]]] = None) -> List[Dict[str, Any]]:
+        """Find a minimal set of requirements that cannot all be met together.
+        
+        Every course's weekly meetings, every teacher's availability and
+        load rules and every room's capacity and type become a requirement
+        group switched on by an assumption literal. CP-SAT returns a set of
+        assumptions sufficient for infeasibility, which is then shrunk by
+        dropping one requirement at a time while it stays infeasible.
+        Returns an empty list when the requirements can be met after all, or
+        no core was found within what is left of the generation's time limit.
+        """
+        self._reset_model()
+        self.explain = True
+        try:
+            self._create_variables(snapshot, fixed)
+            self._add_basic_constraints(snapshot)
+            self._add_rule_constraints(snapshot)
+        finally:
+            self.explain = False
+        groups = {literal.Index(): group for group, literal in self.assumptions.items()}
+        
+        def core_of(candidates: List[Tuple[str, int]]):
+            """Sufficient core of the candidate groups, or None when they are satisfiable or time ran out"""
+            remaining = self._time_left()
+            if remaining == 0 or self.stop_requested:
+                return None
+            self.model.ClearAssumptions()
+            self.model.AddAssumptions([self.assumptions[group] for group in candidates])
+            self.solver = cp_model.CpSolver()
+            self.settings.apply(self.solver)
+            # Counting arguments over assumption literals need the full LP relaxation
+            self.solver.parameters.linearization_level = 2
+            if remaining is not None:
+                self.solver.parameters.max_time_in_seconds = remaining
+            if self.solver.Solve(self.model) != cp_model.INFEASIBLE:
+                return None
+            return [groups[index] for index in self.solver.SufficientAssumptionsForInfeasibility()]
+        
+        with self._timed('explain'):
+            core = core_of(list(self.assumptions))
+            if core is None:
+                return []
+            for group in list(core):
+                if group not in core or len(core) == 1:
+                    continue
+                smaller = core_of([other for other in core if other != group])
+                if smaller is not None:
+                    core = smaller
+        
+        rules = SchedulingRules.from_rules(snapshot.rules)
+        return [
+            {'group': kind, 'id': object_id, 'description': self._describe_requirement(snapshot, rules, kind, object_id)}
+            for kind, object_id in sorted(core)
+        ]
+    
+    def _describe_requirement(self, snapshot: SchedulingSnapshot, rules: SchedulingRules,
+                              kind: str, object_id: int) -> str:
+        """Human-readable statement of one requirement group"""
+        if kind == 'course':
+            course = next(c for c in snapshot.courses if c.id == object_id)
+            meetings = f"{course.sessions} times a week"
+            if course.block_length > 1:
+                meetings += f" for {course.block_length} consecutive periods"
+            return f"Course {course.name} meets {meetings} with one teacher of its department"
+        if kind == 'room':
+            room = next(r for r in snapshot.rooms if r.id == object_id)
+            kind_of_room = f"a {room.room_type} room" if room.room_type else "a room without a type"
+            return f"Room {room.name} seats {room.capacity} students and is {kind_of_room}"
+        
+        teacher = next(t for t in snapshot.teachers if t.id == object_id)
+        if kind == 'availability':
+            return f"Teacher {teacher.name} is unavailable in {len(snapshot.unavailable.get(teacher.id, ()))} timeslots"
+        if kind == 'weekly_hours':
+            return f"Teacher {teacher.name} teaches at most {rules.weekly_minutes(teacher.max_hours_per_week) / 60:g} hours a week"
+        if kind == 'daily_hours':
+            return f"Teacher {teacher.name} teaches at most {rules.max_hours_per_day:g} hours a day"
+        if kind == 'consecutive':
+            return f"Teacher {teacher.name} teaches at most {rules.max_consecutive} periods in a row"
+        if kind == 'breaks':
+            if not rules.allow_back_to_back:
+                return f"Teacher {teacher.name} has no back-to-back classes"
+            return f"Teacher {teacher.name} has at least {rules.min_gap_minutes} minutes between classes"
+        return f"Teacher {teacher.name} keeps a {rules.lunch_break_minutes} minute lunch break"
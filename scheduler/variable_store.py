@@ -0,0 +1,66 @@
+from array import array
+from typing import Dict, Iterator, List, Tuple
+from ortools.sat.python import cp_model
+
+# Dimensions of a scheduling tuple, in storage order
+DIMENSIONS = ('course', 'teacher', 'room', 'timeslot')
+
+
+class VariableStore:
+    """Compact, integer-indexed table of scheduling decision variables.
+
+    Every variable gets a dense index. The course, teacher, room and timeslot
+    ids of that index are kept in parallel integer arrays, so constraint
+    builders group variables by id tuples and solution extraction reads the
+    assignment back without any string handling.
+    """
+
+    def __init__(self, model: cp_model.CpModel):
+        self.model = model
+        self.columns = {dimension: array('i') for dimension in DIMENSIONS}
+        self.literals = []
+
+    def __len__(self) -> int:
+        return len(self.literals)
+
+    def add(self, course_id: int, teacher_id: int, room_id: int, timeslot_id: int) -> int:
+        """Create a boolean variable for the tuple and return its index"""
+        self.columns['course'].append(course_id)
+        self.columns['teacher'].append(teacher_id)
+        self.columns['room'].append(room_id)
+        self.columns['timeslot'].append(timeslot_id)
+        self.literals.append(self.model.NewBoolVar(''))
+        return len(self.literals) - 1
+
+    def tuple_at(self, index: int) -> Tuple[int, int, int, int]:
+        """Return the (course, teacher, room, timeslot) ids of a variable"""
+        return (
+            self.columns['course'][index],
+            self.columns['teacher'][index],
+            self.columns['room'][index],
+            self.columns['timeslot'][index]
+        )
+
+    def group_by(self, *dimensions: str) -> Dict[Tuple[int, ...], List[int]]:
+        """Bucket variable indices by the ids of the given dimensions"""
+        columns = [self.columns[dimension] for dimension in dimensions]
+        groups = {}
+        for index, key in enumerate(zip(*columns)):
+            groups.setdefault(key, []).append(index)
+        return groups
+
+    def group_by_many(self, *groupings: Tuple[str, ...]) -> List[Dict[Tuple[int, ...], List[int]]]:
+        """Bucket variable indices for several groupings in a single pass"""
+        key_columns = [[self.columns[dimension] for dimension in grouping] for grouping in groupings]
+        buckets = [{} for _ in groupings]
+        rows = zip(*(zip(*columns) for columns in key_columns))
+        for index, keys in enumerate(rows):
+            for groups, key in zip(buckets, keys):
+                groups.setdefault(key, []).append(index)
+        return buckets
+
+    def selected(self, solver: cp_model.CpSolver) -> Iterator[Tuple[int, int, int, int]]:
+        """Yield the tuples whose variable is true in the solver's solution"""
+        for index, literal in enumerate(self.literals):
+            if solver.BooleanValue(literal):
+                yield self.tuple_at(index)
@@ -5,6 +5,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeModals();
     initializeTooltips();
     initializeFormValidation();
+    initializeGenerationJob();
 });
 
 // Initialize timetable-specific functionality
@@ -214,6 +215,92 @@ function handleDragEnd() {
     });
 }
 
+// Poll a background timetable generation job until it finishes
+function initializeGenerationJob() {
+    const panel = document.getElementById('generation-job');
+    if (!panel) {
+        return;
+    }
+
+    const jobUrl = panel.dataset.jobUrl;
+    const pollInterval = 2000;
+    const acceptButton = panel.querySelector('.job-accept');
+
+    acceptButton.addEventListener('click', function() {
+        acceptButton.disabled = true;
+        fetch(panel.dataset.acceptUrl, { method: 'POST', headers: { 'Accept': 'application/json' } })
+            .then(response => {
+                if (!response.ok) {
+                    acceptButton.disabled = false;
+                }
+            })
+            .catch(() => { acceptButton.disabled = false; });
+    });
+
+    function poll() {
+        fetch(jobUrl, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(job => {
+                panel.querySelector('.job-message').textContent = job.message || 'Generating timetable.';
+                renderGenerationProgress(panel, job);
+                if (job.done) {
+                    showGenerationJobResult(panel, job);
+                } else {
+                    setTimeout(poll, pollInterval);
+                }
+            })
+            .catch(() => setTimeout(poll, pollInterval * 2));
+    }
+
+    setTimeout(poll, pollInterval);
+}
+
+// Show the best solution found so far and offer to accept it
+function renderGenerationProgress(panel, job) {
+    const progress = job.progress || [];
+    const acceptButton = panel.querySelector('.job-accept');
+    acceptButton.classList.toggle('d-none', job.done || progress.length === 0 || job.stop_requested);
+
+    if (progress.length === 0) {
+        return;
+    }
+
+    const best = progress[progress.length - 1];
+    let summary = `Solution ${best.solution}: ${best.placed} classes placed after ${best.wall_time.toFixed(1)}s`;
+    if (best.objective !== null) {
+        summary += `, objective ${best.objective}`;
+        if (best.best_bound !== null) {
+            summary += ` (bound ${best.best_bound})`;
+        }
+    }
+    panel.querySelector('.job-progress-summary').textContent = summary;
+    panel.querySelector('.job-progress').classList.remove('d-none');
+}
+
+function showGenerationJobResult(panel, job) {
+    const succeeded = job.status === 'succeeded';
+    panel.classList.remove('alert-info');
+    panel.classList.add(succeeded ? 'alert-success' : 'alert-danger');
+    panel.querySelector('.job-spinner').classList.add('d-none');
+
+    const conflicts = (job.result && job.result.conflicts) || [];
+    const conflictList = panel.querySelector('.job-conflicts');
+    conflicts.forEach(conflict => {
+        const item = document.createElement('li');
+        item.textContent = conflict;
+        conflictList.appendChild(item);
+    });
+    conflictList.classList.toggle('d-none', conflicts.length === 0);
+
+    if (succeeded) {
+        const reloadLink = document.createElement('a');
+        reloadLink.href = window.location.href;
+        reloadLink.className = 'alert-link ms-2';
+        reloadLink.textContent = 'Show new timetable';
+        panel.querySelector('.job-message').after(reloadLink);
+    }
+}
+
 // Utility functions
 function showAlert(message, type = 'info') {
     const alertContainer = document.createElement('div');
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+from hashlib import sha1
+from typing import Any, Optional, Tuple
+from flask import Response, make_response, request
+
+TimetableVersion = Tuple[int, Optional[datetime]]
+
+# The timetable page embeds the signed-in user, so only the browser may keep
+# it, and it has to ask before reusing it
+PAGE_CACHE_CONTROL = 'private, no-cache'
+
+# Exports may be stored by shared caches too, but every reuse is revalidated
+# against an ETag scoped to the institution and department, so a cache never
+# hands one scope's export to another
+EXPORT_CACHE_CONTROL = 'public, no-cache'
+
+
+def timetable_etag(version: TimetableVersion, *scope: Any) -> str:
+    """Strong ETag for a response built from a timetable version.
+
+    scope holds everything else the response depends on, such as the
+    institution, department, user or export format.
+    """
+    number, updated_at = version
+    parts = [str(part) for part in scope] + [str(number), updated_at.isoformat() if updated_at else '']
+    return sha1(':'.join(parts).encode()).hexdigest()[:24]
+
+
+def _last_modified(version: TimetableVersion) -> Optional[datetime]:
+    _, updated_at = version
+    return updated_at.replace(tzinfo=timezone.utc, microsecond=0) if updated_at else None
+
+
+def with_validators(response: Response, etag: str, version: TimetableVersion, cache_control: str) -> Response:
+    """Add ETag, Last-Modified and Cache-Control headers to a response"""
+    response.set_etag(etag)
+    last_modified = _last_modified(version)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Cookie')
+    return response
+
+
+def not_modified(etag: str, version: TimetableVersion, cache_control: str) -> Optional[Response]:
+    """A 304 response when the client's copy is current, None when the body must be built.
+
+    If-None-Match takes precedence over If-Modified-Since, which only has
+    second resolution.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        last_modified = _last_modified(version)
+        fresh = bool(last_modified and request.if_modified_since
+                     and last_modified <= request.if_modified_since)
+    if not fresh:
+        return None
+    return with_validators(make_response('', 304), etag, version, cache_control)
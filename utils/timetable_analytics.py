@@ -0,0 +1,119 @@
+from typing import Any, Dict
+from sqlalchemy import case, func
+from models import Course, Room, Teacher, TimeSlot, TimetableEntry
+from app import db
+from .timetable_queries import DAYS_OF_WEEK, load_timeslots
+
+
+def _percent(part: float, whole: float) -> float:
+    return round(part / whole * 100, 1) if whole else 0.0
+
+
+def timetable_analytics(institution_id: int, department_id: int = None) -> Dict[str, Any]:
+    """Class counts, hours, utilisation and capacity slack of a timetable.
+
+    Every figure is aggregated by the database with GROUP BY, so the cost
+    depends on the number of rooms, teachers and days rather than entries.
+    A timeslot's length enters the sums as a CASE over its id, which keeps
+    room-hour utilisation in SQL on every backend. department_id limits
+    the figures to that department's courses.
+    """
+    timeslots = load_timeslots(institution_id)
+    slot_minutes = {ts.id: ts.minutes for ts in timeslots}
+    week_minutes = sum(slot_minutes.values())
+    day_minutes = {}
+    for ts in timeslots:
+        day_minutes[ts.day_of_week] = day_minutes.get(ts.day_of_week, 0) + ts.minutes
+    room_count = db.session.query(func.count(Room.id)).filter(Room.institution_id == institution_id).scalar()
+
+    minutes = case(slot_minutes, value=TimetableEntry.timeslot_id, else_=0) if slot_minutes else 0
+    classes = func.count(TimetableEntry.id)
+
+    def aggregate(*columns):
+        query = db.session.query(*columns).select_from(TimetableEntry) \
+            .join(Course, Course.id == TimetableEntry.course_id) \
+            .filter(TimetableEntry.institution_id == institution_id)
+        if department_id:
+            query = query.filter(Course.department_id == department_id)
+        return query
+
+    totals = aggregate(
+        classes,
+        func.sum(case((TimetableEntry.is_manual == True, 1), else_=0)),  # noqa: E712
+        func.sum(minutes),
+        func.sum(Room.capacity),
+        func.sum(Course.student_count),
+        func.sum(case((Course.student_count > Room.capacity, 1), else_=0))
+    ).join(Room, Room.id == TimetableEntry.room_id).one()
+    total_classes, manual, booked_minutes, seats_offered, seats_used, over_capacity = (value or 0 for value in totals)
+
+    rooms = [
+        {
+            'id': row.id,
+            'name': row.name,
+            'code': row.code,
+            'capacity': row.capacity,
+            'classes': row.classes,
+            'hours': round((row.minutes or 0) / 60, 1),
+            'utilization_percent': _percent(row.minutes or 0, week_minutes),
+            'seat_utilization_percent': _percent(row.students or 0, row.capacity * row.classes),
+            'average_empty_seats': round(row.capacity - (row.students or 0) / row.classes, 1)
+        }
+        for row in aggregate(
+            Room.id, Room.name, Room.code, Room.capacity, classes.label('classes'),
+            func.sum(minutes).label('minutes'), func.sum(Course.student_count).label('students')
+        ).join(Room, Room.id == TimetableEntry.room_id)
+        .group_by(Room.id, Room.name, Room.code, Room.capacity).order_by(Room.name, Room.id)
+    ]
+
+    teachers = [
+        {
+            'id': row.id,
+            'name': row.name,
+            'classes': row.classes,
+            'hours': round((row.minutes or 0) / 60, 1),
+            'max_hours': row.max_hours_per_week,
+            'load_percent': _percent((row.minutes or 0) / 60, row.max_hours_per_week or 0)
+        }
+        for row in aggregate(
+            Teacher.id, Teacher.name, Teacher.max_hours_per_week, classes.label('classes'),
+            func.sum(minutes).label('minutes')
+        ).join(Teacher, Teacher.id == TimetableEntry.teacher_id)
+        .group_by(Teacher.id, Teacher.name, Teacher.max_hours_per_week).order_by(Teacher.name, Teacher.id)
+    ]
+
+    day_rows = {
+        row.day_of_week: row
+        for row in aggregate(TimeSlot.day_of_week, classes.label('classes'), func.sum(minutes).label('minutes'))
+        .join(TimeSlot, TimeSlot.id == TimetableEntry.timeslot_id).group_by(TimeSlot.day_of_week)
+    }
+    days = [
+        {
+            'day': DAYS_OF_WEEK[day],
+            'classes': day_rows[day].classes if day in day_rows else 0,
+            'hours': round((day_rows[day].minutes or 0) / 60, 1) if day in day_rows else 0.0,
+            'utilization_percent': _percent(day_rows[day].minutes or 0, available * room_count)
+            if day in day_rows else 0.0
+        }
+        for day, available in sorted(day_minutes.items())
+    ]
+
+    return {
+        'total_classes': total_classes,
+        'manual_classes': manual,
+        'automatic_classes': total_classes - manual,
+        'total_timeslots': len(timeslots),
+        'total_rooms': room_count,
+        'scheduled_hours': round(booked_minutes / 60, 1),
+        'utilization_percent': _percent(booked_minutes, week_minutes * room_count),
+        'rooms': rooms,
+        'teachers': teachers,
+        'days': days,
+        'capacity': {
+            'seats_offered': seats_offered,
+            'seats_used': seats_used,
+            'seat_utilization_percent': _percent(seats_used, seats_offered),
+            'average_empty_seats': round((seats_offered - seats_used) / total_classes, 1) if total_classes else 0.0,
+            'over_capacity_classes': over_capacity
+        }
+    }
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Optional, Tuple
+import logging
+import os
+import pickle
+
+# Timetable views each worker process keeps in memory
+CACHE_SIZE = int(os.environ.get('TIMETABLE_CACHE_SIZE', '256'))
+
+# Optional Redis server shared by all workers, e.g. redis://localhost:6379/0
+SHARED_CACHE_URL = os.environ.get('TIMETABLE_CACHE_REDIS_URL')
+
+# Seconds a view stays in the shared cache; a new version replaces it anyway
+SHARED_CACHE_TTL = int(os.environ.get('TIMETABLE_CACHE_TTL', '86400'))
+
+
+class LRUCache:
+    """Thread-safe mapping that drops the least recently used item beyond max_size"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+local_cache = LRUCache(CACHE_SIZE)
+
+shared_cache = None
+if SHARED_CACHE_URL:
+    try:
+        import redis
+        shared_cache = redis.Redis.from_url(SHARED_CACHE_URL)
+    except ImportError:
+        logging.warning("TIMETABLE_CACHE_REDIS_URL is set but the redis package is not installed")
+
+
+def _shared_get(key: str) -> Any:
+    if shared_cache is None:
+        return None
+    try:
+        value = shared_cache.get(key)
+    except Exception as e:
+        logging.warning(f"Shared timetable cache read error: {e}")
+        return None
+    return pickle.loads(value) if value is not None else None
+
+
+def _shared_set(key: str, value: Any):
+    if shared_cache is None:
+        return
+    try:
+        shared_cache.set(key, pickle.dumps(value), ex=SHARED_CACHE_TTL)
+    except Exception as e:
+        logging.warning(f"Shared timetable cache write error: {e}")
+
+
+def cached_timetable_view(institution_id: int, department_id: Optional[int],
+                          version: Tuple[int, Optional[datetime]], build: Callable[[], Any]) -> Any:
+    """Return the view cached for this timetable version, building it on a miss.
+
+    The version is the institution's timetable version and the time it was
+    last bumped, so views of older versions are never served and simply age
+    out. The in-process cache is checked first, then the shared one.
+    """
+    number, updated_at = version
+    key = (f"timetable-view:{institution_id}:{department_id or 'all'}:{number}:"
+           f"{updated_at.isoformat() if updated_at else ''}")
+    value = local_cache.get(key)
+    if value is None:
+        value = _shared_get(key)
+        if value is None:
+            value = build()
+            _shared_set(key, value)
+        local_cache.set(key, value)
+    return value
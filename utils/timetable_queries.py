@@ -0,0 +1,184 @@
+from dataclasses import dataclass
+from datetime import datetime, time
+from typing import Any, Dict, List, Optional
+from models import Course, Room, Teacher, TimeSlot, TimetableEntry
+from app import db
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+@dataclass(frozen=True)
+class CourseRow:
+    id: int
+    code: str
+    name: str
+    credits: int
+    department_id: int
+
+
+@dataclass(frozen=True)
+class TeacherRow:
+    id: int
+    name: str
+    department_id: int
+
+
+@dataclass(frozen=True)
+class RoomRow:
+    id: int
+    code: str
+    name: str
+    capacity: int
+    building: Optional[str]
+
+
+@dataclass(frozen=True)
+class TimeSlotRow:
+    id: int
+    day_of_week: int
+    start_time: time
+    end_time: time
+    period_name: Optional[str]
+
+    @property
+    def minutes(self) -> int:
+        today = datetime.min.date()
+        return int((datetime.combine(today, self.end_time) - datetime.combine(today, self.start_time)).total_seconds() // 60)
+
+
+@dataclass(frozen=True)
+class EntryRow:
+    """A timetable entry with the rows it refers to, detached from the session"""
+    id: int
+    section: str
+    is_manual: bool
+    course: CourseRow
+    teacher: TeacherRow
+    room: RoomRow
+    timeslot: TimeSlotRow
+
+
+def _shared(cache: dict, row_type: type, values: tuple):
+    """One row object per id, so entries referring to the same row share it"""
+    if values[0] not in cache:
+        cache[values[0]] = row_type(*values)
+    return cache[values[0]]
+
+
+@dataclass(frozen=True)
+class PeriodColumn:
+    """Timeslots of different days sharing start and end time"""
+    key: str
+    start_time: time
+    end_time: time
+    period_name: Optional[str]
+
+
+def period_key(timeslot: TimeSlotRow) -> str:
+    return f"{timeslot.start_time.strftime('%H:%M')}-{timeslot.end_time.strftime('%H:%M')}"
+
+
+def load_timetable_entries(institution_id: int = None, department_id: int = None, teacher_id: int = None,
+                           room_id: int = None, course_id: int = None, section: str = None) -> List[EntryRow]:
+    """Timetable entries with course, teacher, room and timeslot in one joined query.
+
+    institution_id None loads every institution, department_id limits the
+    entries to that department's courses and the other filters to one
+    teacher, room, course or section. Entries sharing a course, teacher,
+    room or timeslot share one row object.
+    """
+    query = db.session.query(
+        TimetableEntry.id, TimetableEntry.section, TimetableEntry.is_manual,
+        Course.id, Course.code, Course.name, Course.credits, Course.department_id,
+        Teacher.id, Teacher.name, Teacher.department_id,
+        Room.id, Room.code, Room.name, Room.capacity, Room.building,
+        TimeSlot.id, TimeSlot.day_of_week, TimeSlot.start_time, TimeSlot.end_time, TimeSlot.period_name
+    ).join(Course, Course.id == TimetableEntry.course_id) \
+        .join(Teacher, Teacher.id == TimetableEntry.teacher_id) \
+        .join(Room, Room.id == TimetableEntry.room_id) \
+        .join(TimeSlot, TimeSlot.id == TimetableEntry.timeslot_id)
+    if institution_id:
+        query = query.filter(TimetableEntry.institution_id == institution_id)
+    if department_id:
+        query = query.filter(Course.department_id == department_id)
+    if teacher_id:
+        query = query.filter(TimetableEntry.teacher_id == teacher_id)
+    if room_id:
+        query = query.filter(TimetableEntry.room_id == room_id)
+    if course_id:
+        query = query.filter(TimetableEntry.course_id == course_id)
+    if section:
+        query = query.filter(TimetableEntry.section == section)
+
+    courses, teachers, rooms, timeslots = {}, {}, {}, {}
+    entries = []
+    for row in query.order_by(TimeSlot.day_of_week, TimeSlot.start_time, TimetableEntry.id):
+        entries.append(EntryRow(
+            row[0], row[1], bool(row[2]),
+            _shared(courses, CourseRow, tuple(row[3:8])),
+            _shared(teachers, TeacherRow, tuple(row[8:11])),
+            _shared(rooms, RoomRow, tuple(row[11:16])),
+            _shared(timeslots, TimeSlotRow, tuple(row[16:21]))
+        ))
+    return entries
+
+
+def load_timeslots(institution_id: int = None) -> List[TimeSlotRow]:
+    """Timeslots in weekly order, of every institution when institution_id is None"""
+    query = db.session.query(
+        TimeSlot.id, TimeSlot.day_of_week, TimeSlot.start_time, TimeSlot.end_time, TimeSlot.period_name
+    )
+    if institution_id:
+        query = query.filter(TimeSlot.institution_id == institution_id)
+    return [TimeSlotRow(*row) for row in query.order_by(TimeSlot.day_of_week, TimeSlot.start_time)]
+
+
+def load_courses(institution_id: int = None) -> List[CourseRow]:
+    """Courses by id, of every institution when institution_id is None"""
+    query = db.session.query(Course.id, Course.code, Course.name, Course.credits, Course.department_id)
+    if institution_id:
+        query = query.filter(Course.institution_id == institution_id)
+    return [CourseRow(*row) for row in query.order_by(Course.id)]
+
+
+def build_timetable_view(institution_id: int = None, department_id: int = None) -> Dict[str, Any]:
+    """Everything the timetable page shows that depends only on the timetable.
+
+    Built from plain rows only, so the result can be cached and pickled.
+    """
+    entries = load_timetable_entries(institution_id, department_id)
+    timeslots = load_timeslots(institution_id)
+
+    total_periods = len(timeslots) * 6  # 6 working days
+    return {
+        'entries': entries,
+        'grid': week_grid(timeslots, entries),
+        'analytics': {
+            'total_periods': total_periods,
+            'scheduled_periods': len(entries),
+            'utilization_percent': round((len(entries) / total_periods * 100) if total_periods > 0 else 0, 1)
+        },
+        'subject_summary': load_courses(institution_id)
+    }
+
+
+def week_grid(timeslots: List[TimeSlotRow], entries: List[EntryRow]) -> Dict[str, Any]:
+    """Day rows, period columns and the entries meeting in each day and period.
+
+    Cells hold lists, since several classes can meet at once in a
+    department or institution wide view.
+    """
+    periods = {}
+    for timeslot in sorted(timeslots, key=lambda ts: (ts.start_time, ts.end_time)):
+        key = period_key(timeslot)
+        if key not in periods:
+            periods[key] = PeriodColumn(key, timeslot.start_time, timeslot.end_time, timeslot.period_name)
+    cells = {}
+    for entry in entries:
+        day = cells.setdefault(DAYS_OF_WEEK[entry.timeslot.day_of_week], {})
+        day.setdefault(period_key(entry.timeslot), []).append(entry)
+    return {
+        'days': [DAYS_OF_WEEK[day] for day in sorted({ts.day_of_week for ts in timeslots})],
+        'periods': list(periods.values()),
+        'cells': cells
+    }